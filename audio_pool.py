@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import gemini_processing
+from audio_preprocess import PREPROCESS_ENABLED, discard_preprocessed, preprocess_many
+from gemini_processing import find_cached_result, process_audio_file
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+DEFAULT_WORKERS = int(os.getenv("GEMINI_WORKERS", "8"))
+# Requests-per-minute quota for MODEL_NAME on our Gemini project.
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "60"))
+
+
+# ---------------------------------------------
+# Rate Limiting
+# ---------------------------------------------
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate_per_minute`
+    up to `capacity`; acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate_per_minute / 10.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Block until `tokens` are available, then take them.
+
+        A request larger than the capacity goes through once the bucket is full and
+        leaves it in debt for the remainder, so later callers wait until the full
+        amount has refilled and the long-run rate never exceeds `rate_per_minute`.
+        """
+        needed = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ---------------------------------------------
+# Processing Pool
+# ---------------------------------------------
+def count_transfers(results) -> dict:
+    """
+    {transfer path: files} from process_audio_file results (inline, upload, chunked, cached).
+    """
+    counts = {}
+    for result in results:
+        if isinstance(result, dict) and result.get("transfer"):
+            counts[result["transfer"]] = counts.get(result["transfer"], 0) + 1
+    return counts
+
+
+def requests_per_file(single_call):
+    """
+    Model requests one process_audio_file call makes: transcription, summary and
+    parse_text_to_json, or a single structured request.
+    """
+    if single_call is None:
+        single_call = gemini_processing.SINGLE_CALL_MODE
+    return 1 if single_call else 3
+
+
+def process_audio_folder(folder: str = "downloads", max_workers: int = DEFAULT_WORKERS,
+                         requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                         single_call: bool = None, process_fn=process_audio_file,
+                         preprocess: bool = None) -> list:
+    """
+    Run process_audio_file over every file in `folder` concurrently.
+
+    Each file takes as many tokens from a shared TokenBucket as it makes model
+    requests, so total throughput tracks the Gemini requests-per-minute quota
+    rather than one call at a time.
+
+    Args:
+        folder (str): Folder of downloaded recordings named <s_id>.<ext>.
+        max_workers (int): Files processed in parallel.
+        requests_per_minute (int): Gemini RPM quota to stay under.
+        single_call (bool, optional): Passed through to process_audio_file.
+        process_fn (callable): Replacement for process_audio_file, e.g. a stub in tests.
+            Called as process_fn(path, s_id=..., single_call=..., preprocess=False, cache_key=...,
+            limiter=...).
+        preprocess (bool, optional): Shrink every file with ffmpeg in a process pool
+            first (audio_preprocess). Defaults to AUDIO_PREPROCESS.
+
+    Returns:
+        list: One dict per file with file, s_id, ok, error, seconds and result.
+    """
+    filenames = sorted(
+        name for name in os.listdir(folder)
+        if os.path.isfile(os.path.join(folder, name)) and not name.endswith((".part", ".part.json"))
+    )
+    if not filenames:
+        print(f"⚠️ No audio files found in {folder}")
+        return []
+
+    limiter = TokenBucket(requests_per_minute)
+    tokens_per_file = requests_per_file(single_call)
+    preprocess = PREPROCESS_ENABLED if preprocess is None else preprocess
+
+    # Cache hits are neither preprocessed nor charged against the quota
+    cache_keys, hits = {}, set()
+    for filename in filenames:
+        path = os.path.join(folder, filename)
+        try:
+            cache_keys[path], cached = find_cached_result(path, single_call, preprocess)
+        except Exception as e:
+            print(f"⚠️ Transcription cache lookup failed for {filename}: {e}")
+            continue
+        if cached:
+            hits.add(path)
+
+    upload_paths = {}
+    if preprocess:
+        upload_paths = preprocess_many(os.path.join(folder, filename) for filename in filenames
+                                       if os.path.join(folder, filename) not in hits)
+
+    def _run(filename):
+        s_id = filename.split(".")[0]
+        path = os.path.join(folder, filename)
+        upload_path = upload_paths.get(path, path)
+        report = {"file": path, "s_id": s_id, "ok": False, "error": None, "result": None}
+        if path not in hits:
+            limiter.acquire(tokens_per_file)
+        started = time.perf_counter()
+        try:
+            report["result"] = process_fn(upload_path, s_id=s_id, single_call=single_call, preprocess=False,
+                                          cache_key=cache_keys.get(path), limiter=limiter)
+            report["ok"] = True
+        except Exception as e:
+            report["error"] = str(e)
+        finally:
+            if upload_path != path:
+                discard_preprocessed(upload_path)
+        report["seconds"] = time.perf_counter() - started
+        return report
+
+    started = time.perf_counter()
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(_run, filename) for filename in filenames]
+        for future in as_completed(futures):
+            report = future.result()
+            if report["ok"]:
+                print(f"✅ Processed {report['s_id']} in {report['seconds']:.1f}s")
+            else:
+                print(f"❌ Failed {report['s_id']}: {report['error']}")
+            reports.append(report)
+
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for report in reports if report["ok"])
+    print(f"\n🎉 Processed {succeeded}/{len(reports)} files in {elapsed:.1f}s "
+          f"({len(reports) / max(elapsed, 1e-9) * 60:.1f} files/min)")
+    transfers = count_transfers(report["result"] for report in reports)
+    if transfers:
+        print("📊 Audio sent: " + ", ".join(f"{kind} {count}" for kind, count in sorted(transfers.items())))
+    reports.sort(key=lambda report: report["file"])
+    return reports
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    process_audio_folder("downloads")
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+# Optional dependency: the ffmpeg binary on PATH (or FFMPEG_BINARY). Without it,
+# recordings are uploaded as downloaded.
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+PREPROCESS_ENABLED = os.getenv("AUDIO_PREPROCESS", "0") == "1"
+PREPROCESS_DIR = os.getenv("AUDIO_PREPROCESS_DIR", ".preprocessed")
+PREPROCESS_WORKERS = int(os.getenv("AUDIO_PREPROCESS_WORKERS", str(os.cpu_count() or 2)))
+# Speech-band mono is plenty for phone calls
+SAMPLE_RATE = int(os.getenv("AUDIO_PREPROCESS_RATE", "16000"))
+BITRATE = os.getenv("AUDIO_PREPROCESS_BITRATE", "24k")
+# Trailing audio quieter than this is trimmed down to SILENCE_SECONDS. Leading
+# silence is kept so transcript [MM:SS] timestamps match the original recording.
+SILENCE_THRESHOLD_DB = os.getenv("AUDIO_PREPROCESS_SILENCE_DB", "-45dB")
+SILENCE_SECONDS = float(os.getenv("AUDIO_PREPROCESS_SILENCE_SECONDS", "0.5"))
+OUTPUT_EXTENSION = ".ogg"  # Opus in Ogg, accepted by the Gemini Files API
+FFMPEG_TIMEOUT_SECONDS = int(os.getenv("AUDIO_PREPROCESS_TIMEOUT", "600"))
+
+
+def ffmpeg_path():
+    """
+    Full path of the ffmpeg binary, or None when it is not installed.
+    """
+    return shutil.which(FFMPEG_BINARY)
+
+
+def audio_filter() -> str:
+    """
+    ffmpeg -af chain used by preprocess_audio; part of the transcription cache's prompt version.
+    """
+    # Downmix and resample first so areverse buffers the small mono stream.
+    # silenceremove trims the start, so trim the reversed audio to drop the tail only.
+    trim = (f"silenceremove=start_periods=1:start_silence={SILENCE_SECONDS}"
+            f":start_threshold={SILENCE_THRESHOLD_DB}")
+    return f"aformat=channel_layouts=mono,aresample={SAMPLE_RATE},areverse,{trim},areverse"
+
+
+def ffmpeg_command(src: str, dst: str, ffmpeg: str = None) -> list:
+    """
+    ffmpeg arguments for downmix → resample → trim trailing silence → Opus encode.
+    """
+    return [
+        ffmpeg or FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", src,
+        "-vn", "-af", audio_filter(), "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-c:a", "libopus", "-b:a", BITRATE, "-application", "voip",
+        dst,
+    ]
+
+
+def is_preprocessed(path: str) -> bool:
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(PREPROCESS_DIR)
+
+
+def preprocessed_path(src: str) -> str:
+    name = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(PREPROCESS_DIR, name + OUTPUT_EXTENSION)
+
+
+# ---------------------------------------------
+# Preprocessing
+# ---------------------------------------------
+def preprocess_audio(src: str) -> str:
+    """
+    Make a compact copy of `src` for upload: mono, SAMPLE_RATE Hz, trailing
+    silence trimmed, Opus at BITRATE.
+
+    Falls back to `src` when ffmpeg is missing, fails, or the result would not be
+    smaller. A copy that is newer than `src` is reused. The start is untouched, so
+    transcript timestamps still refer to the original recording.
+
+    Args:
+        src (str): Path of the downloaded recording.
+
+    Returns:
+        str: Path to upload (the preprocessed copy or `src`).
+    """
+    if is_preprocessed(src):
+        return src
+    ffmpeg = ffmpeg_path()
+    if ffmpeg is None:
+        return src
+
+    dst = preprocessed_path(src)
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        return dst
+
+    os.makedirs(PREPROCESS_DIR, exist_ok=True)
+    tmp = f"{os.path.splitext(dst)[0]}.{os.getpid()}.tmp{OUTPUT_EXTENSION}"
+    try:
+        subprocess.run(ffmpeg_command(src, tmp, ffmpeg), check=True, capture_output=True,
+                       timeout=FFMPEG_TIMEOUT_SECONDS)
+    except (OSError, subprocess.SubprocessError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        print(f"⚠️ Preprocessing failed for {os.path.basename(src)}, uploading original: "
+              f"{stderr.decode(errors='replace').strip() or e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return src
+
+    if os.path.getsize(tmp) == 0 or os.path.getsize(tmp) >= os.path.getsize(src):
+        os.remove(tmp)
+        return src
+    os.replace(tmp, dst)
+    return dst
+
+
+def discard_preprocessed(path: str):
+    """
+    Delete a preprocessed copy once it has been uploaded. Originals are never touched.
+    """
+    if path and is_preprocessed(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def preprocess_many(paths, max_workers: int = PREPROCESS_WORKERS) -> dict:
+    """
+    Preprocess many recordings in a process pool (ffmpeg is CPU bound).
+
+    Returns:
+        dict: {original path: path to upload}. Without ffmpeg every path maps to itself.
+    """
+    paths = list(paths)
+    if not paths or ffmpeg_path() is None:
+        if paths:
+            print("⚠️ ffmpeg not found; uploading recordings without preprocessing")
+        return {path: path for path in paths}
+
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = dict(zip(paths, executor.map(preprocess_audio, paths)))
+
+    before = sum(os.path.getsize(path) for path in paths)
+    after = sum(os.path.getsize(result) for result in results.values())
+    print(f"🎚️ Preprocessed {len(paths)} recordings: {before / 1e6:.1f} MB → {after / 1e6:.1f} MB")
+    return results
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    folder = "downloads"
+    files = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+             if not name.endswith((".part", ".part.json"))]
+    for original, result in preprocess_many(files).items():
+        print(f"{original} → {result}")
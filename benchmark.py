@@ -0,0 +1,712 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+BENCH_SIZES = [int(n) for n in os.getenv("BENCH_SIZES", "10,1000,10000").split(",") if n.strip()]
+# Stub Gemini: mean latency per generate_content, +/- jitter fraction, share of requests that fail
+BENCH_GEMINI_LATENCY_MS = float(os.getenv("BENCH_GEMINI_LATENCY_MS", "50"))
+BENCH_GEMINI_JITTER = float(os.getenv("BENCH_GEMINI_JITTER", "0.5"))
+BENCH_GEMINI_FAILURE_RATE = float(os.getenv("BENCH_GEMINI_FAILURE_RATE", "0"))
+BENCH_UPLOAD_LATENCY_MS = float(os.getenv("BENCH_UPLOAD_LATENCY_MS", "30"))
+# Recording size served by the audio server (above GEMINI_INLINE_MAX_BYTES exercises the upload path)
+BENCH_AUDIO_BYTES = int(os.getenv("BENCH_AUDIO_BYTES", str(32 * 1024)))
+# Effectively unlimited by default, so the stub latency (not GEMINI_RPM) sets the pace
+BENCH_RPM = int(os.getenv("BENCH_RPM", "1000000"))
+BENCH_OUTPUT = os.getenv("BENCH_OUTPUT", "benchmark_results.json")
+# A previous BENCH_OUTPUT; a size whose calls/min drops more than BENCH_TOLERANCE below it fails the run
+BENCH_BASELINE = os.getenv("BENCH_BASELINE")
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.2"))
+BENCH_VERBOSE = os.getenv("BENCH_VERBOSE", "0") == "1"
+BENCH_SEED = int(os.getenv("BENCH_SEED", "7"))
+
+BENCH_FROM_DATE = "2025-10-01T00:00:00.000Z"
+BENCH_TO_DATE = "2025-10-01T23:59:59.000Z"
+BENCH_MONGO_URI = "mongodb://benchmark.invalid/"
+
+# Every on-disk store goes to a scratch directory and every endpoint to a local
+# stand-in. The pipeline modules read these at import time, so set them first.
+WORK_DIR = tempfile.mkdtemp(prefix="aud2ins_bench_")
+os.environ.update({
+    "GRAPHQL_CACHE_DIR": os.path.join(WORK_DIR, "graphql_cache"),
+    "TRANSCRIPTION_CACHE_DIR": os.path.join(WORK_DIR, "transcription_cache"),
+    "TRANSCRIPTION_CACHE_MONGO": "0",
+    "TRANSCRIPT_INDEX_PATH": os.path.join(WORK_DIR, "transcript_index.sqlite3"),
+    "JOB_LEDGER_PATH": os.path.join(WORK_DIR, "job_ledger.sqlite3"),
+    "AUDIO_PREPROCESS": "0",
+    "CHUNKED_TRANSCRIPTION": "0",
+    "MONGODB_URI": BENCH_MONGO_URI,
+    "COMPARE_MONGODB_URI": BENCH_MONGO_URI,
+})
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import metrics  # noqa: E402
+import genai_clients  # noqa: E402
+import gemini_processing  # noqa: E402
+from compare import COMPARE_PROMPT  # noqa: E402
+from creating_reference_excel import fetch_graphql_entities, index_by_call_id  # noqa: E402
+from graphql_cache import format_iso_utc, parse_range_bound  # noqa: E402
+from mongo_pool import flush_all_writers, set_mongo_client  # noqa: E402
+from pipeline import run_pipeline  # noqa: E402
+from pymongo import InsertOne, ReplaceOne, UpdateOne  # noqa: E402
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+
+def _serve(handler_class):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True).start()
+    return server
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like S3 and the real endpoint
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# ---------------------------------------------
+# Stand-in: S3 recordings
+# ---------------------------------------------
+class FakeAudioServer:
+    """
+    Serves a synthetic recording for every /<callId>.mp3, with the Content-Length
+    and single-part ETag (MD5) that download_recordings verifies. The callId is
+    written into the bytes, so every call hashes differently and the transcription
+    cache does not short-circuit the run.
+
+    Range requests are answered with 206 when their If-Range matches the ETag (and
+    with the whole object otherwise), as S3 does. Setting `drop_after` cuts the next
+    response off after that many body bytes, like a dropped connection.
+    """
+
+    def __init__(self, size: int = BENCH_AUDIO_BYTES, seed: int = BENCH_SEED):
+        self.data = random.Random(seed).randbytes(max(size, 64))
+        self.requests = 0
+        self.range_requests = 0
+        self.drop_after = None
+        owner = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self):
+                owner.requests += 1
+                body = owner.recording(self.path)
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                status, headers, start = 200, {"ETag": etag}, 0
+                if match and (if_range is None or if_range == etag) and int(match.group(1)) < len(body):
+                    owner.range_requests += 1
+                    start = int(match.group(1))
+                    status = 206
+                    headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                drop_after, owner.drop_after = owner.drop_after, None
+                if drop_after is None:
+                    self._send(status, body[start:], "audio/mpeg", headers)
+                    return
+                # Promise the full length, send part of it, then hang up
+                self.send_response(status)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(body) - start))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body[start:start + drop_after])
+                self.wfile.flush()
+                self.close_connection = True
+
+        self._server = _serve(Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def recording(self, path: str) -> bytes:
+        tag = path.encode("utf-8")[-64:]
+        return tag + self.data[len(tag):]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ---------------------------------------------
+# Stand-in: GraphQL endpoint
+# ---------------------------------------------
+class FakeGraphQLServer:
+    """
+    Answers getCallDataTranscribe with `count` synthetic call records spread over
+    [BENCH_FROM_DATE, BENCH_TO_DATE]. The schema advertises limit/offset, so the
+    real client pages the way it would against a paging-capable server; the date
+    filter is applied as well, so time-window paging works too.
+    """
+
+    CITIES = ("Palayam", "Pattom", "Kowdiar", "Vazhuthacaud", "Kesavadasapuram")
+
+    def __init__(self, audio_base_url: str, count: int = 0):
+        self.audio_base_url = audio_base_url
+        self.requests = 0
+        self.records = []
+        self.set_count(count)
+        owner = self
+
+        class Handler(_QuietHandler):
+            def do_POST(self):
+                owner.requests += 1
+                query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["query"]
+                body = json.dumps(owner.answer(query)).encode("utf-8")
+                self._send(200, body, "application/json")
+
+        self._server = _serve(Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/graphql"
+
+    def set_count(self, count: int):
+        start = parse_range_bound(BENCH_FROM_DATE)
+        span = parse_range_bound(BENCH_TO_DATE) - start
+        self._timestamps = [start + span * i / max(1, count) for i in range(count)]
+        self.records = [self._record(i, ts) for i, ts in enumerate(self._timestamps)]
+
+    def _record(self, i: int, ts: float) -> dict:
+        call_id = f"bench{i:06d}"
+        rent = 6000 + (i % 12) * 500
+        return {
+            "s3Uploaded": True,
+            "entityId": f"entity{i % 500:04d}",
+            "callId": call_id,
+            "entityName": f"Benchmark Hostel {i % 500}",
+            "state": "Kerala",
+            "phone": f"98470{i:05d}",
+            "city": self.CITIES[i % len(self.CITIES)],
+            "country": "India",
+            "status": "active",
+            "description": "Synthetic record generated by benchmark.py",
+            "securityDeposit": rent * 2,
+            "minRent": rent,
+            "maxRent": rent + 2000,
+            "ownerName": "Benchmark Owner",
+            "email": f"owner{i % 500}@example.com",
+            "startedYear": 2015 + i % 10,
+            "fullTimeWarden": bool(i % 2),
+            "visitorsAllowed": not i % 3,
+            "website": None,
+            "entityType": "hostel",
+            "totalBeds": 20 + i % 40,
+            "Recordings": [{
+                "s3Url": f"{self.audio_base_url}/{call_id}.mp3",
+                "dateCreatedInUpdates": format_iso_utc(ts),
+            }],
+        }
+
+    def answer(self, query: str) -> dict:
+        if "__schema" in query:
+            args = [{"name": name} for name in ("fromDate", "toDate", "limit", "offset")]
+            return {"data": {"__schema": {"queryType": {"fields": [{"name": "getCallDataTranscribe", "args": args}]}}}}
+
+        dates = re.search(r'fromDate:\s*"([^"]+)"\s*toDate:\s*"([^"]+)"', query)
+        records = self.records
+        if dates:
+            start, end = parse_range_bound(dates.group(1)), parse_range_bound(dates.group(2), end_of_day=True)
+            records = [record for record, ts in zip(self.records, self._timestamps) if start <= ts <= end]
+        offset = re.search(r"\boffset:\s*(\d+)", query)
+        limit = re.search(r"\blimit:\s*(\d+)", query)
+        first = int(offset.group(1)) if offset else 0
+        records = records[first:first + int(limit.group(1))] if limit else records[first:]
+        return {"data": {"getCallDataTranscribe": records}}
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ---------------------------------------------
+# Stand-in: Gemini
+# ---------------------------------------------
+class StubGenaiClient:
+    """
+    genai.Client look-alike for genai_clients.set_client().
+
+    generate_content sleeps for a jittered latency, fails a configurable share of
+    requests, and answers each prompt the pipeline sends (transcription, summary,
+    parse, single-call structured, single and batched comparison) with text the real
+    parsers accept, plus usage_metadata so token metrics are exercised.
+    """
+
+    def __init__(self, latency_ms: float = BENCH_GEMINI_LATENCY_MS, jitter: float = BENCH_GEMINI_JITTER,
+                 failure_rate: float = BENCH_GEMINI_FAILURE_RATE,
+                 upload_latency_ms: float = BENCH_UPLOAD_LATENCY_MS, seed: int = BENCH_SEED):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.upload_latency = upload_latency_ms / 1000.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "failures": 0, "uploads": 0, "deletes": 0}
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+        self.files = SimpleNamespace(upload=self.upload, delete=self.delete)
+
+    def _pause(self, mean: float) -> bool:
+        """
+        Sleep for mean +/- jitter; returns True when this request should fail.
+        """
+        with self._lock:
+            delay = mean * (1 + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+        time.sleep(max(0.0, delay))
+        return fail
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def upload(self, file, config=None):
+        self._pause(self.upload_latency)
+        self._count("uploads")
+        return SimpleNamespace(name=f"files/bench-{self.counts['uploads']}", mime_type="audio/mpeg")
+
+    def delete(self, name):
+        self._count("deletes")
+
+    def generate_content(self, model, contents, config=None):
+        self._count("requests")
+        if self._pause(self.latency):
+            self._count("failures")
+            raise RuntimeError("503 UNAVAILABLE (injected by benchmark)")
+
+        texts = [part for part in contents if isinstance(part, str)]
+        prompt = texts[0] if texts else ""
+        audio_parts = len(contents) - len(texts)
+        parsed = None
+        if config is not None:
+            parsed = {"transcription": self._transcript(), "summary": self._summary(), "insights": self._insights()}
+            text = json.dumps(parsed)
+        elif "### Item " in prompt:
+            keys = re.findall(r"^### Item (\S+)", prompt, re.MULTILINE)
+            text = json.dumps([{"s_id": key, **self._comparison()} for key in keys])
+        elif COMPARE_PROMPT.strip() in prompt:
+            text = json.dumps(self._comparison())
+        elif prompt == gemini_processing.TRANSCRIPTION_PROMPT:
+            text = self._transcript()
+        elif prompt == gemini_processing.SUMMARY_PROMPT:
+            text = self._summary()
+        elif "Parse the following text into JSON" in prompt:
+            text = json.dumps(self._insights())
+        else:
+            text = "{}"
+
+        prompt_tokens = sum(len(part) for part in texts) // 4 + audio_parts * 1500
+        output_tokens = len(text) // 4
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+                                total_token_count=prompt_tokens + output_tokens,
+                                thoughts_token_count=None, cached_content_token_count=None)
+        return SimpleNamespace(text=text, parsed=parsed, usage_metadata=usage)
+
+    def _transcript(self) -> str:
+        with self._lock:
+            rent = self._random.choice((6500, 7000, 8500, 9000))
+            place = self._random.choice(FakeGraphQLServer.CITIES)
+        return (f"[00:00] Caller: Hi, is a single room available near {place}?\n"
+                f"[00:06] Owner: Yes, rent is {rent:,} per month and the deposit is {rent * 2:,}.\n"
+                "[00:15] Caller: Is food included? I work at Technopark.\n"
+                "[00:21] Owner: Three meals, Wi-Fi and laundry are included.")
+
+    @staticmethod
+    def _summary() -> str:
+        return ("Room Type: single. Cost: 8500 per month. Location: Palayam. "
+                "Status of Inhabitant: working professional. Amenities: food, Wi-Fi, laundry.")
+
+    @staticmethod
+    def _insights() -> dict:
+        return {"Room Type": "single", "Cost": "8500", "Desired Location": "Palayam",
+                "Status of Inhabitant": "working professional",
+                "RoomDetails": {"requested_type": "single", "requested_bathroom_type": None}}
+
+    @staticmethod
+    def _comparison() -> dict:
+        return {"general_comparison": {"price_comparison": {"difference": 0}},
+                "summary": {"overview": "benchmark", "key_takeaways": []},
+                "action_points": [], "match_score": 80, "metadata": {"notes": None}}
+
+
+# ---------------------------------------------
+# Stand-in: MongoDB
+# ---------------------------------------------
+class FakeCollection:
+    """
+    In-memory collection covering what the pipeline uses: create_index,
+    bulk_write (ReplaceOne/UpdateOne upserts, InsertOne), find with equality and $in filters,
+    projections, sort and batch_size, and find_one. Indexed fields use a hash lookup.
+    Set `reject` to {(field, value): errmsg} to make bulk_write refuse matching
+    documents with a BulkWriteError after applying the rest, as an unordered write does.
+    """
+
+    def __init__(self, full_name: str):
+        self.full_name = full_name
+        self.name = full_name.split(".", 1)[1]
+        self._docs = {}
+        self._indexes = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.reject = {}
+
+    def create_index(self, field, unique=False, **options):
+        with self._lock:
+            if field not in self._indexes:
+                index = self._indexes[field] = {}
+                for _id, doc in self._docs.items():
+                    index.setdefault(doc.get(field), set()).add(_id)
+        return f"{field}_1"
+
+    def _index_doc(self, _id, doc, remove=False):
+        for field, index in self._indexes.items():
+            ids = index.setdefault(doc.get(field), set())
+            if remove:
+                ids.discard(_id)
+            else:
+                ids.add(_id)
+
+    def _insert(self, doc: dict):
+        doc = dict(doc)
+        _id = doc.setdefault("_id", self._next_id)
+        self._next_id += 1
+        self._docs[_id] = doc
+        self._index_doc(_id, doc)
+
+    @staticmethod
+    def _matches(doc: dict, query: dict) -> bool:
+        for field, condition in (query or {}).items():
+            if isinstance(condition, dict) and "$in" in condition:
+                if doc.get(field) not in condition["$in"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def _candidate_ids(self, query: dict):
+        for field, condition in (query or {}).items():
+            index = self._indexes.get(field)
+            if index is None:
+                continue
+            values = condition["$in"] if isinstance(condition, dict) and "$in" in condition else [condition]
+            return sorted({_id for value in values for _id in index.get(value, ())})
+        return list(self._docs)
+
+    def _find_ids(self, query: dict) -> list:
+        return [_id for _id in self._candidate_ids(query) if self._matches(self._docs[_id], query)]
+
+    def bulk_write(self, operations, ordered=True):
+        upserted = modified = inserted = 0
+        write_errors = []
+        with self._lock:
+            for position, op in enumerate(operations):
+                document = {**op._filter, **op._doc.get("$set", {})} if isinstance(op, UpdateOne) else \
+                    {**getattr(op, "_filter", {}), **op._doc}
+                errmsg = next((message for (field, value), message in self.reject.items()
+                               if document.get(field) == value), None)
+                if errmsg is not None:
+                    write_errors.append({"index": position, "code": 121, "errmsg": errmsg})
+                    continue
+                if isinstance(op, UpdateOne):
+                    query, update = op._filter, op._doc
+                    ids = self._find_ids(query)
+                    if ids:
+                        doc = self._docs[ids[0]]
+                        self._index_doc(ids[0], doc, remove=True)
+                        doc.update(update.get("$set", {}))
+                        self._index_doc(ids[0], doc)
+                        modified += 1
+                    elif op._upsert:
+                        self._insert({**query, **update.get("$set", {})})
+                        upserted += 1
+                elif isinstance(op, ReplaceOne):
+                    query, replacement = op._filter, op._doc
+                    ids = self._find_ids(query)
+                    if ids:
+                        self._index_doc(ids[0], self._docs[ids[0]], remove=True)
+                        doc = self._docs[ids[0]] = {"_id": ids[0], **replacement}
+                        self._index_doc(ids[0], doc)
+                        modified += 1
+                    elif op._upsert:
+                        self._insert({**query, **replacement})
+                        upserted += 1
+                elif isinstance(op, InsertOne):
+                    self._insert(op._doc)
+                    inserted += 1
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": inserted,
+                                  "nUpserted": upserted, "nModified": modified})
+        return SimpleNamespace(upserted_count=upserted, modified_count=modified, inserted_count=inserted)
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            docs = [self._docs[_id] for _id in self._find_ids(query)]
+        return FakeCursor(docs, projection)
+
+    def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        for field, direction in sort or []:
+            cursor.sort(field, direction)
+        return next(iter(cursor), None)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            for index in self._indexes.values():
+                index.clear()
+
+    def count_documents(self, query=None):
+        with self._lock:
+            return len(self._find_ids(query))
+
+
+class FakeCursor:
+    def __init__(self, docs: list, projection=None):
+        self._docs = docs
+        self._projection = projection
+
+    def sort(self, field, direction=1):
+        self._docs = sorted(self._docs, key=lambda doc: (doc.get(field) is None, doc.get(field)),
+                            reverse=direction == -1)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _project(self, doc: dict) -> dict:
+        projection = self._projection
+        if projection is None:
+            return dict(doc)
+        if not isinstance(projection, dict):
+            projection = {field: 1 for field in projection}
+        if any(not value for field, value in projection.items() if field != "_id"):
+            return {key: value for key, value in doc.items() if projection.get(key, 1)}
+        keep = {field for field, value in projection.items() if value}
+        if projection.get("_id", 1):
+            keep.add("_id")
+        return {key: value for key, value in doc.items() if key in keep}
+
+    def __iter__(self):
+        return (self._project(doc) for doc in self._docs)
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, db_name):
+        client = self
+
+        class _Database:
+            def __getitem__(self, collection_name):
+                full_name = f"{db_name}.{collection_name}"
+                with client._lock:
+                    if full_name not in client._collections:
+                        client._collections[full_name] = FakeCollection(full_name)
+                    return client._collections[full_name]
+
+        return _Database()
+
+    def clear(self):
+        """
+        Empty every collection but keep the objects, since mongo_pool's cached
+        writers hold on to them between benchmark sizes.
+        """
+        with self._lock:
+            collections = list(self._collections.values())
+        for collection in collections:
+            collection.clear()
+
+    def document_counts(self) -> dict:
+        return {name: collection.count_documents() for name, collection in self._collections.items()}
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------
+# Benchmark
+# ---------------------------------------------
+def _stage_table(snapshot: dict, metric: str) -> dict:
+    return {
+        series["labels"].get("stage", ",".join(series["labels"].values())): {
+            "count": series["count"], "mean": series["mean"], "p50": series["p50"], "p95": series["p95"],
+            "max": series["max"],
+        }
+        for series in snapshot["histograms"].get(metric, [])
+    }
+
+
+def _counter_total(snapshot: dict, metric: str, **labels) -> float:
+    return sum(series["value"] for series in snapshot["counters"].get(metric, [])
+               if all(series["labels"].get(k) == v for k, v in labels.items()))
+
+
+def run_benchmark(n: int, graphql: FakeGraphQLServer, client: StubGenaiClient, mongo: FakeMongoClient,
+                  **pipeline_kwargs) -> dict:
+    """
+    Push `n` synthetic calls through the real fetch → download → process →
+    reconcile → compare pipeline against the local stand-ins.
+
+    Returns:
+        dict: n, completed, failed, elapsed, calls_per_minute, latency, the
+        pipeline's stage means, per-stage latency histograms (pipeline stages and
+        the finer metrics.timer stages), token and request totals, and the number of
+        documents written to the in-memory Mongo.
+    """
+    graphql.set_count(n)
+    mongo.clear()
+    # Call ids repeat across sizes; a warm transcription cache would skip the model calls
+    shutil.rmtree(os.environ["TRANSCRIPTION_CACHE_DIR"], ignore_errors=True)
+    metrics.reset()
+    before = dict(client.counts)
+    download_dir = tempfile.mkdtemp(prefix="downloads_", dir=WORK_DIR)
+
+    try:
+        with contextlib.ExitStack() as stack:
+            if not BENCH_VERBOSE:
+                # Per-call progress lines would dominate the output (and the timing) at N=10k
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            started = time.perf_counter()
+            # Reference index for reconciliation, through the same GraphQL client code
+            call_index = index_by_call_id(fetch_graphql_entities(graphql.url, BENCH_FROM_DATE, BENCH_TO_DATE,
+                                                                 use_cache=False))
+            index_seconds = time.perf_counter() - started
+            kwargs = {"requests_per_minute": BENCH_RPM, "use_cache": False, "ledger": None, **pipeline_kwargs}
+            report = run_pipeline(graphql.url, from_date=BENCH_FROM_DATE, to_date=BENCH_TO_DATE, limit=None,
+                                  download_dir=download_dir, call_index=call_index, **kwargs)
+            flush_all_writers()
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+    snapshot = metrics.snapshot()
+    return {
+        "n": n,
+        "completed": report["completed"],
+        "failed": report["failed"],
+        "elapsed": round(report["elapsed"], 3),
+        "calls_per_minute": round(report["calls_per_minute"], 1),
+        "latency": report["latency"],
+        "call_index_seconds": round(index_seconds, 3),
+        "stage_mean_seconds": report["stage_mean_seconds"],
+        "pipeline_stages": _stage_table(snapshot, "pipeline_stage_seconds"),
+        "stages": _stage_table(snapshot, "stage_seconds"),
+        "gemini_requests": client.counts["requests"] - before["requests"],
+        "injected_failures": client.counts["failures"] - before["failures"],
+        "uploads": client.counts["uploads"] - before["uploads"],
+        "tokens": _counter_total(snapshot, "gemini_tokens_total", kind="total"),
+        "transfer": report.get("transfer", {}),
+        "mongo_documents": mongo.document_counts(),
+    }
+
+
+def _print_result(result: dict):
+    latency = result["latency"]
+    fmt = lambda value: f"{value:.2f}s" if value is not None else "-"  # noqa: E731
+    print(f"\n🏁 N={result['n']}: {result['completed']}/{result['n']} compared in {result['elapsed']:.1f}s "
+          f"→ {result['calls_per_minute']:.1f} calls/min (p50 {fmt(latency['p50'])}, p95 {fmt(latency['p95'])})")
+    print(f"   {'stage':<22} {'count':>7} {'mean':>8} {'p50':>8} {'p95':>8}")
+    for table in (result["pipeline_stages"], result["stages"]):
+        for stage, row in sorted(table.items(), key=lambda item: -(item[1]["mean"] or 0) * item[1]["count"]):
+            print(f"   {stage:<22} {row['count']:>7} {fmt(row['mean']):>8} {fmt(row['p50']):>8} {fmt(row['p95']):>8}")
+        print("   " + "-" * 56)
+    print(f"   Gemini requests {result['gemini_requests']} ({result['injected_failures']} injected failures), "
+          f"{int(result['tokens'])} tokens, audio sent {result['transfer']}")
+    if result["failed"]:
+        print(f"⚠️ Failed: {result['failed']}")
+
+
+def check_regressions(results: list, baseline_path: str, tolerance: float = BENCH_TOLERANCE) -> list:
+    """
+    Compare calls/min per N with a saved results file.
+
+    Returns:
+        list: Messages for every size that got slower than the baseline by more than `tolerance`.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["n"]: entry for entry in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["n"])
+        if not previous or not previous.get("calls_per_minute"):
+            continue
+        floor = previous["calls_per_minute"] * (1 - tolerance)
+        if result["calls_per_minute"] < floor:
+            regressions.append(f"N={result['n']}: {result['calls_per_minute']:.1f} calls/min, "
+                               f"baseline {previous['calls_per_minute']:.1f} (floor {floor:.1f})")
+    return regressions
+
+
+def run_benchmarks(sizes=None, output_path: str = BENCH_OUTPUT, baseline_path: str = BENCH_BASELINE,
+                   **pipeline_kwargs) -> dict:
+    """
+    Run the offline benchmark for every N in `sizes` (default BENCH_SIZES), print a
+    calls/min and stage-latency table per N and write all results to `output_path`.
+
+    Returns:
+        dict: {"config": {...}, "results": [run_benchmark(...) per N], "regressions": [...]}
+    """
+    sizes = sizes or BENCH_SIZES
+    audio = FakeAudioServer()
+    graphql = FakeGraphQLServer(audio.base_url)
+    client = StubGenaiClient()
+    genai_clients.set_client(client)
+    mongo = FakeMongoClient()
+    set_mongo_client(mongo, BENCH_MONGO_URI)
+    config = {
+        "gemini_latency_ms": BENCH_GEMINI_LATENCY_MS, "gemini_jitter": BENCH_GEMINI_JITTER,
+        "gemini_failure_rate": BENCH_GEMINI_FAILURE_RATE, "upload_latency_ms": BENCH_UPLOAD_LATENCY_MS,
+        "audio_bytes": BENCH_AUDIO_BYTES, "requests_per_minute": BENCH_RPM,
+        "single_call": pipeline_kwargs.get("single_call", gemini_processing.SINGLE_CALL_MODE),
+        **{key: value for key, value in pipeline_kwargs.items() if isinstance(value, (int, float, str, bool))},
+    }
+    print(f"📊 Offline benchmark, N = {', '.join(map(str, sizes))} (scratch dir {WORK_DIR})")
+
+    results = []
+    try:
+        for n in sizes:
+            result = run_benchmark(n, graphql, client, mongo, **pipeline_kwargs)
+            _print_result(result)
+            results.append(result)
+    finally:
+        graphql.close()
+        audio.close()
+
+    regressions = check_regressions(results, baseline_path) if baseline_path and os.path.exists(baseline_path) else []
+    report = {"config": config, "results": results, "regressions": regressions}
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n💾 Results written to {output_path}")
+    for message in regressions:
+        print(f"❌ Throughput regression: {message}")
+    return report
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    try:
+        report = run_benchmarks()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    sys.exit(1 if report["regressions"] else 0)
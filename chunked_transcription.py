@@ -0,0 +1,227 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_preprocess import BITRATE, SAMPLE_RATE, ffmpeg_path
+from genai_clients import get_or_upload, release_upload
+from metrics import record_usage, submit_in_context, timer
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+# Optional: needs ffmpeg and ffprobe (same optional dependency as audio_preprocess)
+CHUNKING_ENABLED = os.getenv("CHUNKED_TRANSCRIPTION", "0") == "1"
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+# Only recordings longer than this are split
+CHUNK_MIN_DURATION_SECONDS = float(os.getenv("CHUNK_MIN_DURATION_SECONDS", "600"))
+# Preferred chunk length; cuts move to the nearest silence within [0.5x, 1.5x]
+CHUNK_TARGET_SECONDS = float(os.getenv("CHUNK_TARGET_SECONDS", "240"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "4"))
+CHUNK_RETRIES = int(os.getenv("CHUNK_RETRIES", "2"))
+SILENCE_NOISE_DB = os.getenv("CHUNK_SILENCE_DB", "-35dB")
+SILENCE_MIN_SECONDS = float(os.getenv("CHUNK_SILENCE_SECONDS", "0.4"))
+
+_TIMESTAMP = re.compile(r"\[(\d{1,3}):(\d{2})(?::(\d{2}))?\]")
+
+
+# ---------------------------------------------
+# Probing and Planning
+# ---------------------------------------------
+def probe_duration(path: str):
+    """
+    Duration of `path` in seconds via ffprobe, or None if it cannot be read.
+    """
+    ffprobe = shutil.which(FFPROBE_BINARY)
+    if ffprobe is None:
+        return None
+    try:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            check=True, capture_output=True, text=True, timeout=60,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def detect_silences(path: str) -> list:
+    """
+    (start, end) seconds of every silence found by ffmpeg's silencedetect filter.
+    """
+    ffmpeg = ffmpeg_path()
+    if ffmpeg is None:
+        return []
+    try:
+        result = subprocess.run(
+            [ffmpeg, "-hide_banner", "-nostats", "-i", path,
+             "-af", f"silencedetect=noise={SILENCE_NOISE_DB}:d={SILENCE_MIN_SECONDS}", "-f", "null", "-"],
+            capture_output=True, text=True, timeout=600,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return []
+    starts = [float(value) for value in re.findall(r"silence_start: (-?[\d.]+)", result.stderr)]
+    ends = [float(value) for value in re.findall(r"silence_end: ([\d.]+)", result.stderr)]
+    return list(zip(starts, ends))
+
+
+def plan_chunks(duration: float, silences: list, target: float = CHUNK_TARGET_SECONDS) -> list:
+    """
+    Split [0, duration] into (start, end) chunks of about `target` seconds, cutting
+    in the middle of a silence when one falls between 0.5x and 1.5x the target
+    and at exactly `target` otherwise.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    chunks, cursor = [], 0.0
+    while duration - cursor > target * 1.5:
+        ideal = cursor + target
+        candidates = [m for m in midpoints if cursor + target * 0.5 <= m <= cursor + target * 1.5]
+        cut = min(candidates, key=lambda m: abs(m - ideal)) if candidates else ideal
+        chunks.append((cursor, cut))
+        cursor = cut
+    chunks.append((cursor, duration))
+    return chunks
+
+
+def should_chunk(path: str):
+    """
+    Duration of `path` when it qualifies for chunked transcription, else None.
+    """
+    if not CHUNKING_ENABLED or ffmpeg_path() is None:
+        return None
+    duration = probe_duration(path)
+    if duration is None or duration <= CHUNK_MIN_DURATION_SECONDS:
+        return None
+    return duration
+
+
+# ---------------------------------------------
+# Timestamps
+# ---------------------------------------------
+def format_timestamp(seconds: float) -> str:
+    """
+    [MM:SS] with minutes allowed past 59, matching TRANSCRIPTION_PROMPT.
+    """
+    seconds = max(0, int(round(seconds)))
+    return f"[{seconds // 60:02d}:{seconds % 60:02d}]"
+
+
+def shift_timestamps(text: str, offset_seconds: float) -> str:
+    """
+    Add `offset_seconds` to every [MM:SS] (or [HH:MM:SS]) timestamp in `text`.
+    """
+    def _shift(match):
+        first, second, third = match.groups()
+        if third is None:
+            seconds = int(first) * 60 + int(second)
+        else:
+            seconds = int(first) * 3600 + int(second) * 60 + int(third)
+        return format_timestamp(seconds + offset_seconds)
+
+    return _TIMESTAMP.sub(_shift, text)
+
+
+def stitch_transcripts(parts: list) -> str:
+    """
+    Join (offset_seconds, transcript) pairs in order, with offset-corrected timestamps.
+    """
+    return "\n".join(shift_timestamps(text.strip(), offset) for offset, text in parts if text and text.strip())
+
+
+# ---------------------------------------------
+# Chunked Transcription
+# ---------------------------------------------
+def split_audio(path: str, chunks: list, out_dir: str) -> list:
+    """
+    Cut `path` into compact mono Opus files, one per (start, end) chunk.
+
+    Returns:
+        list: (start_seconds, chunk_path) in order.
+    """
+    ffmpeg = ffmpeg_path()
+    pieces = []
+    for index, (start, end) in enumerate(chunks):
+        chunk_path = os.path.join(out_dir, f"chunk_{index:03d}.ogg")
+        subprocess.run(
+            [ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+             "-ss", f"{start:.3f}", "-to", f"{end:.3f}", "-i", path,
+             "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "libopus", "-b:a", BITRATE, chunk_path],
+            check=True, capture_output=True, timeout=600,
+        )
+        pieces.append((start, chunk_path))
+    return pieces
+
+
+def _transcribe_chunk(client, chunk_path: str, prompt: str, model: str, retries: int, limiter=None) -> str:
+    # Only this chunk is retried; the upload handle is reused between attempts
+    for attempt in range(retries + 1):
+        try:
+            audio_file = get_or_upload(client, chunk_path)
+            if limiter is not None:
+                limiter.acquire(1)  # every attempt is a model request against the RPM quota
+            with timer("chunk_transcription"):
+                response = client.models.generate_content(model=model, contents=[prompt, audio_file])
+            record_usage(response, "chunk_transcription")
+            release_upload(client, chunk_path)
+            return response.text or ""
+        except Exception as e:
+            if attempt == retries:
+                raise RuntimeError(f"{os.path.basename(chunk_path)}: {e}")
+            print(f"⚠️ Retrying {os.path.basename(chunk_path)} after error: {e}")
+            time.sleep(2 ** attempt)
+
+
+def transcribe_chunked(client, audio_path: str, prompt: str, model: str, duration: float = None,
+                       target_seconds: float = CHUNK_TARGET_SECONDS, max_workers: int = CHUNK_WORKERS,
+                       retries: int = CHUNK_RETRIES, limiter=None) -> str:
+    """
+    Transcribe a long recording as concurrently processed chunks.
+
+    The audio is cut at silences into chunks of about `target_seconds`. Each chunk
+    is transcribed on its own with `prompt`, and a failed chunk is retried up to
+    `retries` times without redoing the rest. The chunk transcripts are joined in
+    order with their [MM:SS] timestamps shifted by the chunk's start time.
+
+    Args:
+        client: genai.Client (or a compatible stub).
+        audio_path (str): Recording to transcribe.
+        prompt (str): Transcription prompt, e.g. gemini_processing.TRANSCRIPTION_PROMPT.
+        model (str): Model name.
+        duration (float, optional): Known duration in seconds; probed if omitted.
+        target_seconds (float): Preferred chunk length.
+        max_workers (int): Chunks transcribed in parallel.
+        retries (int): Extra attempts per chunk.
+        limiter (audio_pool.TokenBucket, optional): Charged one token per chunk
+            request, retries included, so chunking stays within the RPM quota.
+
+    Returns:
+        str: The stitched transcription.
+
+    Raises:
+        RuntimeError: If the audio cannot be split or a chunk still fails after its retries.
+    """
+    duration = duration or probe_duration(audio_path)
+    if duration is None:
+        raise RuntimeError(f"Could not read the duration of {audio_path}")
+    chunks = plan_chunks(duration, detect_silences(audio_path), target_seconds)
+
+    with tempfile.TemporaryDirectory(prefix="chunks_") as out_dir:
+        try:
+            with timer("chunk_split"):
+                pieces = split_audio(audio_path, chunks, out_dir)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise RuntimeError(f"Splitting {audio_path} failed: {e}")
+        print(f"✂️ Transcribing {os.path.basename(audio_path)} as {len(pieces)} chunks")
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [
+                (offset, submit_in_context(executor, _transcribe_chunk, client, chunk_path, prompt, model, retries,
+                                           limiter))
+                for offset, chunk_path in pieces
+            ]
+            parts = [(offset, future.result()) for offset, future in futures]
+
+    return stitch_transcripts(parts)
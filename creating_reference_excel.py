@@ -2,7 +2,9 @@ import requests
 import json
 import pandas as pd
 import os
-from pymongo import MongoClient
+from mongo_pool import ensure_indexes, find_by_s_ids, flush_all_writers, get_collection
+from graphql_cache import fetch_call_data
+from metrics import timer
 
 # =====================================================
 # CONFIGURATION
@@ -11,113 +13,181 @@ from pymongo import MongoClient
 GRAPHQL_URL = "https://42fd29e5b225.ngrok-free.app/graphql"  # Replace with your actual endpoint
 MONGO_URI = os.getenv("MONGODB_URI")
 
+GRAPHQL_FROM_DATE = "2025-10-01T18:30:00.000Z"
+GRAPHQL_TO_DATE = "2025-10-30T17:59:59.000Z"
+
 # =====================================================
-# FUNCTION DEFINITION
+# GRAPHQL HELPERS
 # =====================================================
 
-def process_s_id(s_id: str):
+def fetch_graphql_entities(url: str = GRAPHQL_URL, from_date: str = GRAPHQL_FROM_DATE,
+                           to_date: str = GRAPHQL_TO_DATE, use_cache: bool = True):
     """
-    Given an s_id, fetch corresponding MongoDB record,
-    match it with GraphQL call data, and export both
-    to a structured Excel file.
+    Run the getCallDataTranscribe query once (through graphql_cache) and return its records.
 
-    Args:
-        s_id (str): The unique identifier to process.
+    Raises:
+        requests.RequestException: If the HTTP request fails.
     """
-    print(f"\n🚀 Processing s_id: {s_id}")
+    return fetch_call_data(url, from_date, to_date, use_cache=use_cache)
 
-    # --- Step 1: Connect to MongoDB ---
-    client = MongoClient(MONGO_URI)
-    db = client["audio_processing"]
-    collection = db["audio_results"]
 
-    # Fetch the Mongo document for given s_id
-    mongo_doc = collection.find_one({"s_id": s_id})
-    if not mongo_doc:
-        print(f"❌ No document found in MongoDB for s_id: {s_id}")
-        return None
-
-    # --- Step 2: Run GraphQL Query ---
-    query = """
-    query GetEntityByHid {
-        getCallDataTranscribe(
-            fromDate: "2025-10-01T18:30:00.000Z"
-            toDate: "2025-10-30T17:59:59.000Z"
-        ) {
-            s3Uploaded
-            entityId
-            callId
-            entityName
-            state
-            phone
-            city
-            country
-            status
-            description
-            securityDeposit
-            minRent
-            maxRent
-            ownerName
-            email
-            startedYear
-            fullTimeWarden
-            visitorsAllowed
-            website
-            entityType
-            totalBeds
-            Recordings {
-                s3Url
-                dateCreatedInUpdates
-            }
-        }
-    }
+def index_by_call_id(entities):
+    """
+    Build a {callId: entity} dict. The first record wins for duplicate callIds,
+    matching the old DataFrame `.iloc[0]` behaviour.
     """
+    index = {}
+    for entity in entities:
+        call_id = entity.get("callId")
+        if call_id is not None and call_id not in index:
+            index[call_id] = entity
+    return index
 
+
+def build_call_index(url: str = GRAPHQL_URL, from_date: str = GRAPHQL_FROM_DATE,
+                     to_date: str = GRAPHQL_TO_DATE):
+    """
+    Fetch GraphQL call data once and index it by callId. Returns None on failure.
+    """
     try:
-        response = requests.post(GRAPHQL_URL, json={"query": query})
-        response.raise_for_status()
-        data = response.json()
+        entities = fetch_graphql_entities(url, from_date, to_date)
     except Exception as e:
         print(f"❌ GraphQL query failed: {e}")
         return None
-
-    entities = data.get("data", {}).get("getCallDataTranscribe", [])
     if not entities:
         print("❌ No data returned from GraphQL")
         return None
+    return index_by_call_id(entities)
 
-    graphql_df = pd.DataFrame(entities)
-
-    # --- Step 3: Match Mongo s_id with GraphQL callId ---
-    match_row = graphql_df[graphql_df["callId"] == s_id]
-    if match_row.empty:
-        print(f"❌ No matching callId found in GraphQL for s_id: {s_id}")
-        return None
 
-    print(f"✅ Match found for s_id: {s_id}")
-
-    # --- Step 4: Extract and flatten details ---
-    entity_row = match_row.iloc[0].to_dict()
+def flatten_entity(entity: dict) -> dict:
+    """
+    Copy a GraphQL entity, replacing its Recordings list with count/first-recording columns.
+    """
+    entity_row = dict(entity)
     recordings = entity_row.get("Recordings", [])
     if isinstance(recordings, list) and recordings:
         entity_row["recordings_count"] = len(recordings)
         entity_row["first_recording_url"] = recordings[0].get("s3Url")
         entity_row["first_recording_date"] = recordings[0].get("dateCreatedInUpdates")
     entity_row.pop("Recordings", None)
+    return entity_row
+
+
+# =====================================================
+# FUNCTION DEFINITION
+# =====================================================
+
+def reconcile_s_ids(s_ids, call_index: dict = None, projection=None) -> dict:
+    """
+    Join many s_ids against MongoDB and GraphQL call data in one pass.
 
-    # --- Step 5: Prepare Excel sheets ---
-    mongo_summary = pd.DataFrame([{"s_id": s_id, "source": "A", "_id": str(mongo_doc.get("_id"))}])
-    entity_info_df = pd.DataFrame([entity_row])
-    final_df = pd.concat([mongo_summary, entity_info_df], axis=1)
+    GraphQL is queried at most once (skipped entirely when `call_index` is given),
+    MongoDB with batched `$in` lookups on the indexed s_id field, and each s_id is
+    matched with a dict lookup instead of a DataFrame scan.
 
-    mongo_full_df = pd.DataFrame([mongo_doc])
-    mongo_full_df = mongo_full_df.applymap(lambda x: json.dumps(x) if isinstance(x, (dict, list)) else x)
+    Args:
+        s_ids (list): s_ids to reconcile.
+        call_index (dict, optional): {callId: entity} from build_call_index.
+        projection (dict, optional): Mongo projection for the audio_results documents.
+            Defaults to the full document, which the comparison step uses as Dataset B.
+
+    Returns:
+        dict: {s_id: {"entity_row", "mongo_doc", "dataset_a", "dataset_b"}} for every
+        s_id found in both MongoDB and GraphQL. dataset_a/dataset_b are the rows of the
+        two combined.xlsx sheets and can go straight to compare.compare_and_store.
+    """
+    if call_index is None:
+        call_index = build_call_index()
+        if call_index is None:
+            return {}
+
+    # Make sure buffered save_to_mongo writes are visible before reading them back
+    flush_all_writers()
+    ensure_indexes(MONGO_URI)
+    collection = get_collection("audio_processing", "audio_results", MONGO_URI)
+
+    in_graphql = [s_id for s_id in s_ids if s_id in call_index]
+    mongo_docs = find_by_s_ids(collection, in_graphql, projection=projection)
+
+    matched = {}
+    for s_id in s_ids:
+        entity = call_index.get(s_id)
+        if entity is None:
+            print(f"❌ No matching callId found in GraphQL for s_id: {s_id}")
+            continue
+        mongo_doc = mongo_docs.get(s_id)
+        if not mongo_doc:
+            print(f"❌ No document found in MongoDB for s_id: {s_id}")
+            continue
+        entity_row = flatten_entity(entity)
+        dataset_a, dataset_b = build_comparison_records(s_id, entity_row, mongo_doc)
+        matched[s_id] = {
+            "entity_row": entity_row,
+            "mongo_doc": mongo_doc,
+            "dataset_a": dataset_a,
+            "dataset_b": dataset_b,
+        }
+
+    print(f"✅ Reconciled {len(matched)}/{len(s_ids)} s_ids")
+    return matched
 
-    # --- Step 6: Save to Excel ---
-    output_path = f"combined.xlsx"
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+
+def build_comparison_records(s_id: str, entity_row: dict, mongo_doc: dict):
+    """
+    Build the comparison inputs in memory: Dataset A (s_id/source/_id + entity columns,
+    the Matched_Entity_Info sheet) and Dataset B (the Mongo document with nested values
+    JSON-encoded, the MongoDB_Full_Document sheet).
+
+    Returns:
+        tuple: (dataset_a, dataset_b), each a one-row list of dicts.
+    """
+    row_a = {"s_id": s_id, "source": "A", "_id": str(mongo_doc.get("_id"))}
+    row_a.update(entity_row)
+
+    row_b = {}
+    for key, value in mongo_doc.items():
+        if key == "_id":
+            value = str(value)
+        elif isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        row_b[key] = value
+    return [row_a], [row_b]
+
+
+def write_combined_excel(s_id: str, entity_row: dict, mongo_doc: dict, output_path: str = "combined.xlsx"):
+    """
+    Write the matched entity row and the full Mongo document to a two-sheet workbook.
+    Optional export: the pipeline hands build_comparison_records output to compare directly.
+    """
+    dataset_a, dataset_b = build_comparison_records(s_id, entity_row, mongo_doc)
+    final_df = pd.DataFrame(dataset_a)
+    mongo_full_df = pd.DataFrame(dataset_b)
+
+    with timer("excel_export"), pd.ExcelWriter(output_path, engine="openpyxl") as writer:
         final_df.to_excel(writer, sheet_name="Matched_Entity_Info", index=False)
         mongo_full_df.to_excel(writer, sheet_name="MongoDB_Full_Document", index=False)
 
     print(f"📁 Excel saved successfully → {output_path}")
-    return output_path
\ No newline at end of file
+    return output_path
+
+
+def process_s_id(s_id: str, call_index: dict = None):
+    """
+    Given an s_id, fetch corresponding MongoDB record,
+    match it with GraphQL call data, and export both
+    to a structured Excel file.
+
+    Args:
+        s_id (str): The unique identifier to process.
+        call_index (dict, optional): {callId: entity} from build_call_index. Pass it
+            when processing many s_ids so GraphQL is only queried once.
+    """
+    print(f"\n🚀 Processing s_id: {s_id}")
+
+    matched = reconcile_s_ids([s_id], call_index=call_index).get(s_id)
+    if not matched:
+        return None
+
+    print(f"✅ Match found for s_id: {s_id}")
+    return write_combined_excel(s_id, matched["entity_row"], matched["mongo_doc"])
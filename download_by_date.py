@@ -2,12 +2,15 @@ import requests
 import json
 import os
 from datetime import datetime, timezone
+from graphql_cache import fetch_call_data
+from download_recordings import create_download_session, download_file_resumable
 
 def fetch_and_download_by_date_created(
     url: str = "https://42fd29e5b225.ngrok-free.app/graphql",
     from_date: str = None,
     to_date: str = None,
-    download_dir: str = "downloads"
+    download_dir: str = "downloads",
+    use_cache: bool = True
 ):
     """
     Fetch call transcription data from GraphQL, filter by dateCreatedInUpdates, 
@@ -18,6 +21,7 @@ def fetch_and_download_by_date_created(
         from_date (str): Start date in YYYY-MM-DD or full ISO format.
         to_date (str): End date in YYYY-MM-DD or full ISO format.
         download_dir (str): Directory to save downloads.
+        use_cache (bool): Serve the GraphQL response from the shared graphql_cache store.
 
     Returns:
         list: List of downloaded file paths.
@@ -38,32 +42,27 @@ def fetch_and_download_by_date_created(
     from_dt = _to_datetime(from_date)
     to_dt = _to_datetime(to_date)
 
-    # --- Fetch all call data ---
+    # --- Fetch all call data (braces doubled: this is a graphql_cache template) ---
     query = """
-    query {
-        getCallDataTranscribe {
+    query {{
+        getCallDataTranscribe {{
             entityName
             callId
-            Recordings {
+            Recordings {{
                 s3Url
                 dateCreatedInUpdates
-            }
-        }
-    }
+            }}
+        }}
+    }}
     """
 
-    headers = {"Content-Type": "application/json"}
-
     print("📡 Fetching data from GraphQL...")
     try:
-        response = requests.post(url, json={"query": query}, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        all_records = fetch_call_data(url, query_template=query, use_cache=use_cache)
     except Exception as e:
         print(f"❌ Error fetching data: {e}")
         return []
 
-    all_records = data.get("data", {}).get("getCallDataTranscribe", [])
     if not all_records:
         print("⚠️ No records returned from API.")
         return []
@@ -73,6 +72,7 @@ def fetch_and_download_by_date_created(
     # --- Prepare download directory ---
     os.makedirs(download_dir, exist_ok=True)
     downloaded_files = []
+    session = create_download_session()
 
     # --- Filter and download ---
     for record in all_records:
@@ -103,16 +103,14 @@ def fetch_and_download_by_date_created(
             filepath = os.path.join(download_dir, filename)
 
             try:
-                res = requests.get(s3_url, stream=True)
-                res.raise_for_status()
-                with open(filepath, "wb") as f:
-                    for chunk in res.iter_content(8192):
-                        f.write(chunk)
+                # Written to <filepath>.part first; an interrupted file is resumed next run.
+                download_file_resumable(session, s3_url, filepath)
                 downloaded_files.append(filepath)
                 print(f"🎧 Downloaded: {filename}")
             except Exception as e:
                 print(f"⚠️ Failed to download {s3_url}: {e}")
 
+    session.close()
     print(f"\n🎉 Total files downloaded: {len(downloaded_files)}")
     return downloaded_files
 
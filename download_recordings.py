@@ -1,8 +1,17 @@
+import io
 import os
+import re
 import json
+import hashlib
+import mimetypes
 import requests
 import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from graphql_fetch import fetch_call_data_transcribe
+from metrics import record_bytes, timer
 
 
 def extract_s3_urls_with_callid(data, current_call_id=None):
@@ -23,12 +32,20 @@ def extract_s3_urls_with_callid(data, current_call_id=None):
     return results
 
 
-def clear_directory(path):
+PARTIAL_SUFFIX = ".part"
+PARTIAL_META_SUFFIX = ".part.json"
+
+
+def clear_directory(path, keep_partial=False):
     """
     Deletes all contents of a directory without deleting the folder itself.
+    With keep_partial=True, interrupted downloads (*.part and their metadata) are
+    left in place so they can be resumed.
     """
     if os.path.exists(path):
         for filename in os.listdir(path):
+            if keep_partial and filename.endswith((PARTIAL_SUFFIX, PARTIAL_META_SUFFIX)):
+                continue
             file_path = os.path.join(path, filename)
             try:
                 if os.path.isfile(file_path) or os.path.islink(file_path):
@@ -41,39 +58,447 @@ def clear_directory(path):
         os.makedirs(path)
 
 
-def download_files(url_pairs, download_dir="downloads"):
+# Larger write buffer than the old 8 KB chunks; recordings are several MB each.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Compare finished downloads against single-part, unencrypted-or-SSE-S3 ETags
+VERIFY_ETAG_MD5 = os.getenv("VERIFY_ETAG_MD5", "1") == "1"
+
+
+def create_download_session(max_workers=8):
     """
-    Downloads all files from the given (callId, s3Url) pairs into the specified folder.
+    Create a requests Session with a connection pool sized for `max_workers` threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _remove_partial(part_path, meta_path):
+    for path in (part_path, meta_path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_partial_etag(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("etag")
+    except (OSError, ValueError):
+        return None
+
+
+def _md5_of_file(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _etag_md5(etag, headers=None):
+    """
+    Return the MD5 hex digest carried by an S3 ETag, or None when the ETag is not a
+    plain content MD5: weak validators, multipart "<md5>-<parts>" ETags, and objects
+    encrypted with SSE-KMS or SSE-C (their ETag is not the MD5 of the plaintext).
+    Set VERIFY_ETAG_MD5=0 to skip the check entirely.
+    """
+    if not VERIFY_ETAG_MD5 or not etag or etag.startswith("W/"):
+        return None
+    headers = headers or {}
+    encryption = (headers.get("x-amz-server-side-encryption") or "").lower()
+    if encryption.startswith("aws:kms") or headers.get("x-amz-server-side-encryption-customer-algorithm"):
+        return None
+    value = etag.strip('"').lower()
+    if re.fullmatch(r"[0-9a-f]{32}", value):
+        return value
+    return None
+
+
+def _stream_to_partial(session, url, part_path, meta_path, chunk_size):
+    """
+    One transfer attempt into `part_path`, resuming from its current size when the
+    ETag saved alongside it is still valid. Returns (bytes_written, resumed_from,
+    expected_total, expected_md5), the last being None when the ETag cannot be checked.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    saved_etag = _read_partial_etag(meta_path) if offset else None
+
+    headers = {}
+    if offset and saved_etag:
+        # If-Range makes the server send the full object (200) if it has changed since.
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = saved_etag
+
+    with session.get(url, stream=True, timeout=(10, 300), headers=headers) as response:
+        if response.status_code == 416:
+            # The partial no longer matches the object; start again next attempt.
+            _remove_partial(part_path, meta_path)
+            raise IOError("requested range not satisfiable, discarded partial file")
+        if response.status_code == 206 and headers:
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", content_range)
+            if not match or int(match.group(1)) != offset:
+                _remove_partial(part_path, meta_path)
+                raise IOError(f"unexpected Content-Range '{content_range}' for offset {offset}")
+            expected_total = int(match.group(2)) if match.group(2) != "*" else None
+            mode = "ab"
+        elif response.status_code == 200:
+            offset = 0
+            length = response.headers.get("Content-Length")
+            expected_total = int(length) if length and length.isdigit() else None
+            mode = "wb"
+        else:
+            raise requests.HTTPError(f"status {response.status_code}", response=response)
+
+        etag = response.headers.get("ETag") or saved_etag
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url.split("?")[0], "etag": etag, "total": expected_total}, f)
+
+        written = 0
+        with open(part_path, mode, buffering=chunk_size) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+        expected_md5 = _etag_md5(etag, response.headers)
+    return written, offset, expected_total, expected_md5
+
+
+def download_file_resumable(session, url, file_path, chunk_size=DOWNLOAD_CHUNK_SIZE, retries=3):
+    """
+    Download `url` to `file_path` via a `<file_path>.part` file that survives crashes.
+
+    An existing partial is resumed with an HTTP Range request (guarded by If-Range
+    on its ETag). The finished file is checked against the expected Content-Length
+    and, for single-part objects without SSE-KMS/SSE-C, the ETag MD5 before being
+    atomically renamed into place. Connection drops are retried from the current offset.
+
+    Args:
+        session (requests.Session): Session used for the GET requests.
+        url (str): Recording URL.
+        file_path (str): Final destination path.
+        chunk_size (int): Read/write buffer size in bytes.
+        retries (int): Extra attempts after a failed transfer.
+
+    Returns:
+        dict: {"bytes": size of the finished file, "resumed_from": offset a leftover partial was resumed at (0 if none)}
+    """
+    with timer("s3_download"):
+        result = _download_resumable(session, url, file_path, chunk_size, retries)
+    record_bytes("s3_download", result["bytes"] - result["resumed_from"])
+    return result
+
+
+def _download_resumable(session, url, file_path, chunk_size, retries):
+    part_path = file_path + PARTIAL_SUFFIX
+    meta_path = file_path + PARTIAL_META_SUFFIX
+    resumed_from = 0
+    if os.path.exists(part_path) and _read_partial_etag(meta_path):
+        resumed_from = os.path.getsize(part_path)
+
+    for attempt in range(retries + 1):
+        try:
+            _, offset, expected_total, expected_md5 = _stream_to_partial(
+                session, url, part_path, meta_path, chunk_size
+            )
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is None or status < 500 or attempt == retries:
+                raise
+            print(f"⚠️ Retrying {os.path.basename(file_path)} after server error {status}")
+            continue
+        except (requests.RequestException, IOError) as e:
+            if attempt == retries:
+                raise
+            print(f"⚠️ Retrying {os.path.basename(file_path)} after error: {e}")
+            continue
+
+        if offset == 0:
+            resumed_from = 0  # the server sent the whole object again
+
+        size = os.path.getsize(part_path)
+        if expected_total is not None and size < expected_total:
+            if attempt == retries:
+                raise IOError(f"incomplete download: {size}/{expected_total} bytes")
+            print(f"⚠️ Resuming {os.path.basename(file_path)} at {size}/{expected_total} bytes")
+            continue
+        if expected_total is not None and size > expected_total:
+            _remove_partial(part_path, meta_path)
+            raise IOError(f"size mismatch: got {size} bytes, expected {expected_total}")
+
+        if expected_md5 and _md5_of_file(part_path, chunk_size) != expected_md5:
+            _remove_partial(part_path, meta_path)
+            raise IOError("ETag checksum mismatch, discarded partial file")
+
+        os.replace(part_path, file_path)
+        _remove_partial(part_path, meta_path)
+        return {"bytes": size, "resumed_from": resumed_from}
+
+    raise IOError(f"download did not complete after {retries + 1} attempts")
+
+
+# ---------------------------------------------
+# Streaming without a local copy
+# ---------------------------------------------
+# Recordings up to this size stay in memory; larger ones spill to an anonymous temp file
+STREAM_MAX_MEMORY = int(os.getenv("STREAM_MAX_MEMORY_MB", "16")) * 1024 * 1024
+
+
+class SpooledBuffer(io.RawIOBase):
+    """
+    Seekable binary buffer kept in memory up to `max_memory` bytes, then moved to an
+    anonymous temporary file. Unlike tempfile.SpooledTemporaryFile it is an io.IOBase
+    on every Python version, which client.files.upload requires for file objects.
     """
-    # 1️⃣ Empty the directory first
-    clear_directory(download_dir)
 
-    # 2️⃣ Proceed with download
+    def __init__(self, max_memory: int = STREAM_MAX_MEMORY, name: str = None):
+        super().__init__()
+        self.max_memory = max_memory
+        self.name = name
+        self.rolled = False
+        self._file = io.BytesIO()
+
+    def _rollover(self):
+        disk = tempfile.TemporaryFile()
+        position = self._file.tell()
+        disk.write(self._file.getvalue())
+        disk.seek(position)
+        self._file = disk
+        self.rolled = True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        if not self.rolled and self._file.tell() + len(data) > self.max_memory:
+            self._rollover()
+        return self._file.write(data)
+
+    def readinto(self, buffer):
+        data = self._file.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def truncate(self, size=None):
+        return self._file.truncate(self._file.tell() if size is None else size)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def guess_audio_mime_type(url: str, default: str = "audio/mpeg") -> str:
+    """
+    MIME type for an uploaded stream, from the URL's file extension.
+    """
+    mime_type, _ = mimetypes.guess_type(url.split("?")[0])
+    if mime_type == "audio/x-wav":
+        mime_type = "audio/wav"
+    return mime_type if mime_type and mime_type.startswith("audio/") else default
+
+
+def stream_recording(session, url, max_memory=STREAM_MAX_MEMORY, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                     retries=3, keep_path=None):
+    """
+    Stream `url` into a SpooledBuffer instead of downloads/.
+
+    A dropped connection resumes with a Range request from the bytes already
+    buffered. The result is checked against Content-Length and, for single-part S3
+    objects, the ETag MD5 (hashed on the fly), like download_file_resumable.
+
+    Args:
+        session (requests.Session): Session used for the GET requests.
+        url (str): Recording URL.
+        max_memory (int): Bytes kept in memory before spilling to a temp file.
+        chunk_size (int): Read size in bytes.
+        retries (int): Extra attempts after a failed transfer.
+        keep_path (str, optional): Also write the recording here (only when a local copy is wanted).
+
+    Returns:
+        tuple: (buffer positioned at 0, {"bytes", "in_memory", "path"})
+    """
+    with timer("s3_stream"):
+        buffer, info = _stream_recording(session, url, max_memory, chunk_size, retries, keep_path)
+    record_bytes("s3_download", info["bytes"])
+    return buffer, info
+
+
+def _stream_recording(session, url, max_memory, chunk_size, retries, keep_path):
+    buffer = SpooledBuffer(max_memory, name=os.path.basename(url.split("?")[0]))
+    digest = hashlib.md5()
+    etag = None
+    expected_total = None
+    expected_md5 = None
+
+    for attempt in range(retries + 1):
+        offset = buffer.tell()
+        headers = {}
+        if offset and etag:
+            headers = {"Range": f"bytes={offset}-", "If-Range": etag}
+        try:
+            with session.get(url, stream=True, timeout=(10, 300), headers=headers) as response:
+                if response.status_code == 206 and headers:
+                    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+                    if not match or int(match.group(1)) != offset:
+                        raise IOError("unexpected Content-Range for resumed stream")
+                    expected_total = int(match.group(2)) if match.group(2) != "*" else None
+                elif response.status_code == 200:
+                    # Full object (first attempt, or the server ignored/failed If-Range)
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                    digest = hashlib.md5()
+                    length = response.headers.get("Content-Length")
+                    expected_total = int(length) if length and length.isdigit() else None
+                else:
+                    raise requests.HTTPError(f"status {response.status_code}", response=response)
+                etag = response.headers.get("ETag") or etag
+                expected_md5 = _etag_md5(etag, response.headers)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    buffer.write(chunk)
+                    digest.update(chunk)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is None or status < 500 or attempt == retries:
+                buffer.close()
+                raise
+            print(f"⚠️ Retrying stream of {buffer.name} after server error {status}")
+            continue
+        except (requests.RequestException, IOError) as e:
+            if attempt == retries:
+                buffer.close()
+                raise
+            print(f"⚠️ Retrying stream of {buffer.name} after error: {e}")
+            continue
+
+        size = buffer.tell()
+        if expected_total is not None and size < expected_total:
+            if attempt == retries:
+                buffer.close()
+                raise IOError(f"incomplete stream: {size}/{expected_total} bytes")
+            continue
+        if expected_total is not None and size > expected_total:
+            buffer.close()
+            raise IOError(f"size mismatch: got {size} bytes, expected {expected_total}")
+        if expected_md5 and digest.hexdigest() != expected_md5:
+            buffer.close()
+            raise IOError("ETag checksum mismatch")
+        break
+    else:
+        buffer.close()
+        raise IOError(f"stream did not complete after {retries + 1} attempts")
+
+    if keep_path:
+        part_path = keep_path + PARTIAL_SUFFIX
+        buffer.seek(0)
+        with open(part_path, "wb") as f:
+            shutil.copyfileobj(buffer, f, chunk_size)
+        os.replace(part_path, keep_path)
+    buffer.seek(0)
+    return buffer, {"bytes": size, "in_memory": not buffer.rolled, "path": keep_path}
+
+
+def download_files_concurrent(url_pairs, download_dir="downloads", max_workers=8,
+                              chunk_size=DOWNLOAD_CHUNK_SIZE, session=None, ledger=None):
+    """
+    Download (callId, s3Url) pairs concurrently over one pooled HTTP session.
+
+    Args:
+        url_pairs (list): (callId, s3Url) tuples, as returned by extract_s3_urls_with_callid.
+        download_dir (str): Folder to download into. It is emptied first, except for
+            .part files left by an interrupted run, which are resumed.
+        max_workers (int): Number of parallel downloads.
+        chunk_size (int): Read/write buffer size in bytes.
+        session (requests.Session, optional): Session to reuse. A pooled one is created if omitted.
+        ledger (job_ledger.JobLedger, optional): Records each call's "downloaded" stage.
+            When given, the folder is not emptied and calls already downloaded by an
+            earlier run (file still present) are skipped.
+
+    Returns:
+        tuple: (downloaded_files, stats) where downloaded_files is the list of paths
+        written (in input order) and stats holds one dict per pair with
+        callId, url, path, bytes, resumed_from, seconds, ok and error.
+    """
+    # 1️⃣ Empty the directory first, keeping interrupted downloads for resumption
+    if ledger is None:
+        clear_directory(download_dir, keep_partial=True)
     os.makedirs(download_dir, exist_ok=True)
-    downloaded_files = []
 
+    # 2️⃣ Resolve target paths; a callId seen twice keeps its last URL, as the serial loop did
+    jobs = {}
     for i, (call_id, url) in enumerate(url_pairs, start=1):
-        try:
-            if not call_id:
-                call_id = f"unknown_{i}"
-            # Use s_id as filename if available, fallback to callId
-            filename = f"{call_id}.mp3"  # Default extension, using callId (which is s_id)
-            file_path = os.path.join(download_dir, filename)
-
-            response = requests.get(url, stream=True)
-            if response.status_code == 200:
-                with open(file_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"✅ Downloaded: {file_path}")
-                downloaded_files.append(file_path)
-            else:
-                print(f"⚠️ Failed to download ({response.status_code}): {url}")
+        if not call_id:
+            call_id = f"unknown_{i}"
+        file_path = os.path.join(download_dir, f"{call_id}.mp3")
+        jobs.pop(file_path, None)
+        jobs[file_path] = (call_id, url)
+
+    own_session = session is None
+    if own_session:
+        session = create_download_session(max_workers)
 
+    def _run(file_path, call_id, url):
+        started = time.perf_counter()
+        stat = {"callId": call_id, "url": url, "path": file_path, "bytes": 0,
+                "resumed_from": 0, "ok": False, "error": None}
+        if ledger is not None and os.path.exists(file_path) and ledger.is_done(call_id, "downloaded"):
+            stat.update(ok=True, bytes=os.path.getsize(file_path), seconds=0.0, skipped=True)
+            return stat
+        try:
+            stat.update(download_file_resumable(session, url, file_path, chunk_size))
+            stat["ok"] = True
+            if ledger is not None:
+                ledger.mark(call_id, "downloaded")
+            print(f"✅ Downloaded: {file_path}")
+        except requests.HTTPError as e:
+            stat["error"] = str(e)
+            print(f"⚠️ Failed to download ({e}): {url}")
         except Exception as e:
+            stat["error"] = str(e)
             print(f"❌ Error downloading {url}: {e}")
+        if ledger is not None and stat["error"]:
+            ledger.mark_failed(call_id, "downloaded", stat["error"])
+        stat["seconds"] = time.perf_counter() - started
+        return stat
+
+    # 3️⃣ Fan out over the pool
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(_run, path, cid, url) for path, (cid, url) in jobs.items()]
+            stats = [future.result() for future in futures]
+    finally:
+        if own_session:
+            session.close()
+
+    downloaded_files = [stat["path"] for stat in stats if stat["ok"]]
+    total_bytes = sum(stat["bytes"] for stat in stats)
+    print(f"\n🎉 Total files downloaded: {len(downloaded_files)} ({total_bytes / 1e6:.1f} MB)")
+    return downloaded_files, stats
 
-    print(f"\n🎉 Total files downloaded: {len(downloaded_files)}")
+
+def download_files(url_pairs, download_dir="downloads", max_workers=1):
+    """
+    Downloads all files from the given (callId, s3Url) pairs into the specified folder.
+
+    Pass max_workers > 1 to download in parallel; use download_files_concurrent
+    directly when per-file byte counts and timings are needed.
+    """
+    downloaded_files, _ = download_files_concurrent(url_pairs, download_dir, max_workers=max_workers)
     return downloaded_files
 
 
@@ -87,7 +512,7 @@ if __name__ == "__main__":
     print(f"\n🔗 Found {len(url_pairs)} files to download")
 
     # 3. Download all files
-    downloaded_files = download_files(url_pairs)
+    downloaded_files, stats = download_files_concurrent(url_pairs, max_workers=8)
 
     # 4. Optional: Output summary as JSON
-    print(json.dumps(downloaded_files, indent=2))
+    print(json.dumps(stats, indent=2))
@@ -2,12 +2,15 @@ import requests
 import json
 import re
 from datetime import datetime, timedelta, timezone
+from contextlib import closing
+from graphql_fetch import iter_call_data_transcribe
 
 def fetch_call_data_by_date(
     url: str = "https://42fd29e5b225.ngrok-free.app/graphql",
     reference_date=None,  # can be None | datetime | "YYYY-MM-DD" | "today"
     days_range: int = 30,
-    limit: int = 10
+    limit: int = 10,
+    use_cache: bool = True
 ):
     """
     Fetch call transcription data from GraphQL endpoint based on a reference date.
@@ -19,6 +22,7 @@ def fetch_call_data_by_date(
         days_range (int, optional): Number of days to look back from reference_date. 
                                   Defaults to 30.
         limit (int, optional): Limit number of records to return. Defaults to 10.
+        use_cache (bool, optional): Serve from / refresh the shared graphql_cache store.
 
     Returns:
         list: List of call transcription data dictionaries (limited by `limit`).
@@ -71,56 +75,11 @@ def fetch_call_data_by_date(
     to_date = _fmt(to_dt)
     from_date = _fmt(from_dt)
 
-    # --- GraphQL query ---
-    query = f"""
-    query GetEntityByHid {{
-        getCallDataTranscribe(
-            fromDate: "{from_date}"
-            toDate: "{to_date}"
-        ) {{
-            s3Uploaded
-            entityId
-            callId
-            entityName
-            state
-            phone
-            city
-            country
-            status
-            description
-            securityDeposit
-            minRent
-            maxRent
-            ownerName
-            email
-            startedYear
-            fullTimeWarden
-            visitorsAllowed
-            website
-            entityType
-            totalBeds
-            Recordings {{
-                s3Url
-                dateCreatedInUpdates
-            }}
-        }}
-    }}
-    """
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-
     try:
-        response = requests.post(url, json={"query": query}, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-            call_data = data.get("data", {}).get("getCallDataTranscribe", [])
-
-            # --- Filter by Recordings.dateCreatedInUpdates (client-side) ---
-            filtered = []
-            for record in call_data:
+        # --- Page through the range, stopping once `limit` records have matched ---
+        filtered = []
+        with closing(iter_call_data_transcribe(url, from_date, to_date, use_cache=use_cache)) as records:
+            for record in records:
                 recordings = record.get("Recordings", [])
                 matched_recs = []
                 for rec in recordings:
@@ -141,12 +100,14 @@ def fetch_call_data_by_date(
                     new_record = dict(record)
                     new_record["Recordings"] = matched_recs
                     filtered.append(new_record)
+                    if len(filtered) >= limit:
+                        break
 
-            return filtered[:limit]
-        else:
-            print(f"❌ Failed! Status code: {response.status_code}")
-            print(response.text)
-            return []
+        return filtered
+    except requests.HTTPError as e:
+        print(f"❌ Failed! Status code: {e.response.status_code}")
+        print(e.response.text)
+        return []
     except Exception as e:
         print(f"⚠️ Error occurred: {e}")
         return []
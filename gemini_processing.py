@@ -1,14 +1,28 @@
 import os
 import pandas as pd
 from io import BytesIO
-from google import genai
-from parse import parse_text_to_json, json_to_excel_bytes
-from pymongo import MongoClient
+import json
+import threading
+from google.genai import types
+from genai_clients import get_client, get_or_upload, release_upload, source_size
+from parse import PARSE_FIELDS, parse_text_to_json, json_to_excel_bytes, insights_response_schema
+from transcription_cache import cache_key, file_sha256, get_cached, prompt_version, put_cached
+from mongo_pool import get_mongo_client, get_writer
+from audio_preprocess import BITRATE, PREPROCESS_ENABLED, audio_filter, discard_preprocessed, preprocess_audio
+from chunked_transcription import should_chunk, transcribe_chunked
+from download_recordings import guess_audio_mime_type
+from transcript_index import index_transcription
+from metrics import call_scope, inc, record_usage, timer
 
 # ---------------------------------------------
 # Configuration
 # ---------------------------------------------
 MODEL_NAME = "gemini-2.5-flash"
+# Default for process_audio_file(single_call=None); set GEMINI_SINGLE_CALL=1 to enable.
+SINGLE_CALL_MODE = os.getenv("GEMINI_SINGLE_CALL", "0") == "1"
+# Audio up to this size is sent inline with the request (no Files API upload/delete).
+# Gemini caps a whole request at 20 MB; 0 disables the inline path.
+INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(4 * 1024 * 1024)))
 
 # --- Prompts ---
 TRANSCRIPTION_PROMPT = (
@@ -33,29 +47,48 @@ SUMMARY_PROMPT = SUMMARY_PROMPT = (
     Ensure that the extraction is accurate, structured, and concise, providing clear labels for each piece of information collected."""
 )
 
+# Transcription, summary and parsed insights in one schema-constrained response.
+STRUCTURED_PROMPT = (
+    "Process the provided audio recording of a phone call and return JSON with three fields.\n\n"
+    "transcription: " + TRANSCRIPTION_PROMPT + "\n\n"
+    "summary: plain text answering the following, using the transcription.\n" + SUMMARY_PROMPT + "\n\n"
+    "insights: the same information as structured fields. Use null for anything not mentioned. "
+    "Under RoomDetails, requested_type is the room type the caller asked for and "
+    "requested_bathroom_type is the bathroom type they asked for."
+)
 
-# ---------------------------------------------
-# MongoDB Setup
-# ---------------------------------------------
-def get_mongo_client():
+
+def structured_response_config() -> types.GenerateContentConfig:
     """
-    Create a MongoDB client using environment variables or default localhost.
+    Generation config that constrains the single-call response to
+    {"transcription": str, "summary": str, "insights": {...}}.
     """
-    mongo_uri = (
-        os.getenv("MONGODB_URI")
-        or os.getenv("MONGO_URI")
-        or "mongodb://localhost:27017/"
+    schema = types.Schema(
+        type="OBJECT",
+        properties={
+            "transcription": types.Schema(type="STRING"),
+            "summary": types.Schema(type="STRING"),
+            "insights": insights_response_schema(),
+        },
+        required=["transcription", "summary", "insights"],
+        property_ordering=["transcription", "summary", "insights"],
     )
-    return MongoClient(mongo_uri)
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
 
+# ---------------------------------------------
+# MongoDB Setup
+# ---------------------------------------------
 def save_to_mongo(s_id, transcription, summary, insights):
     """
     Save processed data to MongoDB.
+
+    The document is buffered and upserted by s_id in bulk (see mongo_pool.BufferedUpsertWriter);
+    call mongo_pool.flush_all_writers() before reading it back. The transcription is
+    also added to the local search index (transcript_index), unless TRANSCRIPT_INDEX=0.
     """
     try:
-        client = get_mongo_client()
-        db = client["audio_processing"]
-        collection = db["audio_results"]
+        writer = get_writer("audio_processing", "audio_results")
 
         document = {
             "s_id": s_id,  # ✅ Added s_id
@@ -64,105 +97,324 @@ def save_to_mongo(s_id, transcription, summary, insights):
             "insights": insights
         }
 
-        inserted_id = collection.insert_one(document).inserted_id
-        print(f"✅ Data saved to MongoDB (Document ID: {inserted_id}) with s_id: {s_id}")
-        client.close()
+        writer.add(document)
+        print(f"✅ Data queued for MongoDB with s_id: {s_id}")
     except Exception as e:
         print(f"❌ Failed to save to MongoDB: {e}")
+        return
+
+    index_transcription(s_id, transcription)
 
 # ---------------------------------------------
-# Core Function
+# Transfer Path Metrics
 # ---------------------------------------------
-def process_audio_file(audio_path: str, s_id: str = None, api_key: str = None) -> dict:
-    """
-    Process an audio file to generate transcription, structured summary, Excel, and store in MongoDB.
+# How each processed file reached the model: "inline", "upload", "chunked" or "cached"
+_transfer_stats = {}
+_transfer_lock = threading.Lock()
 
-    Args:
-        audio_path (str): Path to the local audio file (.mp3, .wav, .m4a).
-        s_id (str, optional): Call identifier (SID).
-        api_key (str, optional): Gemini API key.
 
-    Returns:
-        dict: {
-            "transcription": str,
-            "summary": str,
-            "excel_bytes": BytesIO
-        }
+def _record_transfer(path_taken: str, size: int):
+    with _transfer_lock:
+        stats = _transfer_stats.setdefault(path_taken, {"files": 0, "bytes": 0})
+        stats["files"] += 1
+        stats["bytes"] += size
+    inc("audio_files_total", transfer=path_taken)
+    inc("audio_bytes_total", size, transfer=path_taken)
+
+
+def transfer_stats() -> dict:
     """
-    # --------------------------
-    # API Setup
-    # --------------------------
-    api_key = (
-        api_key
-        or os.getenv("GENAI_API_KEY")
-        or os.getenv("GEMINI_API_KEY")
-        or os.getenv("GOOGLE_API_KEY")
-        or os.getenv("API_KEY")
-    )
+    {path: {"files", "bytes"}} for every file processed in this process.
+    """
+    with _transfer_lock:
+        return {path_taken: dict(stats) for path_taken, stats in _transfer_stats.items()}
 
-    if not api_key:
-        raise ValueError("❌ Gemini API key not found. Please set it in environment variables or pass it explicitly.")
 
-    client = genai.Client(api_key=api_key)
+def _inline_part(source, mime_type: str) -> types.Part:
+    if hasattr(source, "read"):
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
 
-    # --------------------------
-    # Step 1: Upload Audio
-    # --------------------------
-    try:
-        audio_file = client.files.upload(file=audio_path)
-    except Exception as e:
-        raise RuntimeError(f"Audio upload failed: {e}")
 
+# ---------------------------------------------
+# Core Function
+# ---------------------------------------------
+def _transcribe_and_summarize(client, audio_file):
+    """
+    The original three-request path: transcription, summary, then parse_text_to_json.
+    Returns (transcription, summary, parsed_json).
+    """
     # --------------------------
     # Step 2: Transcription
     # --------------------------
     try:
-        transcription_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[TRANSCRIPTION_PROMPT, audio_file]
-        )
+        with timer("transcription"):
+            transcription_response = client.models.generate_content(
+                model=MODEL_NAME,
+                contents=[TRANSCRIPTION_PROMPT, audio_file]
+            )
+        record_usage(transcription_response, "transcription")
         transcription = transcription_response.text
     except Exception as e:
         raise RuntimeError(f"Transcription failed: {e}")
 
+    summary, parsed_json = _summarize_and_parse(client, transcription)
+    return transcription, summary, parsed_json
+
+
+def _summarize_and_parse(client, transcription):
+    """
+    Steps 3-4 on an existing transcription. Returns (summary, parsed_json).
+    """
     # --------------------------
     # Step 3: Summarization
     # --------------------------
     try:
-        summary_response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[SUMMARY_PROMPT, transcription]
-        )
+        with timer("summary"):
+            summary_response = client.models.generate_content(
+                model=MODEL_NAME,
+                contents=[SUMMARY_PROMPT, transcription]
+            )
+        record_usage(summary_response, "summary")
         summary = summary_response.text
     except Exception as e:
         raise RuntimeError(f"Summary generation failed: {e}")
 
     # --------------------------
-    # Step 4: Parse Summary → JSON → Excel
+    # Step 4: Parse Summary → JSON
     # --------------------------
     try:
-        parsed_json = parse_text_to_json(summary)
+        with timer("parse_insights"):
+            parsed_json = parse_text_to_json(summary)
         if isinstance(parsed_json, dict) and parsed_json.get("error"):
             raise ValueError(f"Parsing failed: {parsed_json.get('error')}")
-        excel_bytes = json_to_excel_bytes(parsed_json)
     except Exception as e:
         raise RuntimeError(f"Excel generation failed: {e}")
 
+    return summary, parsed_json
+
+
+def _structured_transcription(client, audio_file):
+    """
+    Steps 2-4 in one schema-constrained request. Returns (transcription, summary, parsed_json).
+    """
+    try:
+        with timer("structured"):
+            response = client.models.generate_content(
+                model=MODEL_NAME,
+                contents=[STRUCTURED_PROMPT, audio_file],
+                config=structured_response_config()
+            )
+        record_usage(response, "structured")
+        structured = response.parsed if isinstance(response.parsed, dict) else json.loads(response.text)
+        return structured["transcription"], structured["summary"], structured["insights"]
+    except Exception as e:
+        raise RuntimeError(f"Structured transcription failed: {e}")
+
+
+def _prompt_version(single_call: bool) -> str:
+    """
+    Version hash of everything that shapes a result in the given mode.
+    """
+    if single_call:
+        return prompt_version(STRUCTURED_PROMPT, structured_response_config().model_dump_json())
+    return prompt_version(TRANSCRIPTION_PROMPT, SUMMARY_PROMPT, PARSE_FIELDS)
+
+
+def transcription_cache_key(audio_path, single_call: bool = None, preprocess: bool = None) -> str:
+    """
+    Transcription cache key of a recording: SHA-256 of the audio as downloaded (not
+    of the ffmpeg copy, which is rebuilt every run), the model, the prompts of the
+    mode, and the preprocessing settings when the model is sent a preprocessed copy.
+    """
+    if single_call is None:
+        single_call = SINGLE_CALL_MODE
+    if preprocess is None:
+        preprocess = PREPROCESS_ENABLED
+    version = _prompt_version(single_call)
+    if preprocess and not hasattr(audio_path, "read"):
+        version = prompt_version(version, audio_filter(), BITRATE)
+    return cache_key(file_sha256(audio_path), MODEL_NAME, version)
+
+
+def find_cached_result(audio_path, single_call: bool = None, preprocess: bool = None):
+    """
+    Look a recording up in the transcription cache before spending any work on it
+    (preprocessing, rate-limit tokens, model requests).
+
+    Returns:
+        tuple: (key, entry). Pass the key on as process_audio_file(cache_key=...);
+        entry is None on a miss.
+    """
+    with timer("cache_lookup"):
+        key = transcription_cache_key(audio_path, single_call, preprocess)
+        return key, get_cached(key)
+
+
+def process_audio_file(audio_path, s_id: str = None, api_key: str = None,
+                       single_call: bool = None, use_cache: bool = True, preprocess: bool = None,
+                       mime_type: str = None, cache_key: str = None, limiter=None) -> dict:
+    """
+    Process an audio file to generate transcription, structured summary, Excel, and store in MongoDB.
+
+    Args:
+        audio_path (str | file object): Path to the local audio file (.mp3, .wav, .m4a),
+            or a seekable binary buffer such as download_recordings.stream_recording
+            returns. Buffers are uploaded directly, without preprocessing or chunking.
+        s_id (str, optional): Call identifier (SID).
+        api_key (str, optional): Gemini API key.
+        single_call (bool, optional): Get transcription, summary and insights from one
+            schema-constrained request instead of three sequential ones. Defaults to
+            SINGLE_CALL_MODE (env GEMINI_SINGLE_CALL).
+        use_cache (bool): Reuse a stored result for identical audio (same SHA-256,
+            model and prompt version) instead of calling the model.
+        preprocess (bool, optional): Upload a mono, resampled, tail-trimmed copy
+            (audio_preprocess, needs ffmpeg). Defaults to AUDIO_PREPROCESS.
+        mime_type (str, optional): MIME type of a buffer upload. Defaults to audio/mpeg.
+        cache_key (str, optional): Key from find_cached_result() on the original
+            recording, for callers that hand in an already preprocessed copy.
+        limiter (audio_pool.TokenBucket, optional): Bucket the caller already charged
+            for this file's usual requests. Requests beyond those (one per chunk of
+            a chunked transcription, plus summary and parse in single-call mode)
+            are charged to it as they are made.
+
+    Audio up to INLINE_MAX_BYTES (env GEMINI_INLINE_MAX_BYTES) is sent inline with the
+    generation request, skipping the Files API upload and delete; larger files are uploaded.
+
+    Returns:
+        dict: {
+            "transcription": str,
+            "summary": str,
+            "excel_bytes": BytesIO,
+            "insights": dict,
+            "cached": bool,
+            "transfer": "inline" | "upload" | "chunked" | "cached",
+            "tokens": {"prompt", "output", "total", ...} summed over this call's model requests
+        }
+    """
+    # Stage timings, bytes and token usage below are attributed to this call (see metrics.py)
+    with call_scope(s_id or str(getattr(audio_path, "name", audio_path))) as call:
+        result = _process_audio_file(audio_path, s_id, api_key, single_call, use_cache, preprocess, mime_type,
+                                     cache_key, limiter)
+        result["tokens"] = dict(call.tokens) if call is not None else {}
+    return result
+
+
+def _process_audio_file(audio_path, s_id, api_key, single_call, use_cache, preprocess, mime_type, key, limiter):
+    if single_call is None:
+        single_call = SINGLE_CALL_MODE
+    if preprocess is None:
+        preprocess = PREPROCESS_ENABLED
+    is_buffer = hasattr(audio_path, "read")
+    name = (getattr(audio_path, "name", None) or s_id) if is_buffer else os.path.basename(audio_path)
+    upload_kwargs = {"config": {"mime_type": mime_type or "audio/mpeg"}} if is_buffer else {}
+
     # --------------------------
-    # Step 5: Save to MongoDB
+    # Step 0: Content-hash cache on the original recording
+    # (same audio + model + prompts → no ffmpeg and no model calls)
     # --------------------------
+    cached = None
+    if use_cache:
+        if key is None:
+            key, cached = find_cached_result(audio_path, single_call, preprocess)
+        else:
+            with timer("cache_lookup"):
+                cached = get_cached(key)
+    else:
+        key = None
+
+    if cached:
+        transfer = "cached"
+        size = source_size(audio_path)
+        print(f"💾 Transcription cache hit for {name}")
+        transcription = cached["transcription"]
+        summary = cached["summary"]
+        parsed_json = cached["insights"]
+    else:
+        # The uploaded file: the compact copy when preprocessing is on
+        if preprocess and not is_buffer:
+            with timer("preprocess"):
+                upload_path = preprocess_audio(audio_path)
+        else:
+            upload_path = audio_path
+        size = source_size(upload_path)
+
+        # --------------------------
+        # API Setup (shared client, created once per process)
+        # --------------------------
+        client = get_client(api_key)
+        duration = None if is_buffer else should_chunk(upload_path)
+
+        if duration:
+            transfer = "chunked"
+            # --------------------------
+            # Long recording: chunks transcribed in parallel, then Steps 3-4
+            # (single-call mode included; one request over the whole call is the slow path)
+            # --------------------------
+            # The prepaid transcription token is not refunded; each chunk request takes its own
+            if limiter is not None and single_call:
+                limiter.acquire(2)  # summary and parse, which single-call mode did not pay for
+            try:
+                transcription = transcribe_chunked(client, upload_path, TRANSCRIPTION_PROMPT, MODEL_NAME,
+                                                   duration=duration, limiter=limiter)
+            except Exception as e:
+                raise RuntimeError(f"Transcription failed: {e}")
+            summary, parsed_json = _summarize_and_parse(client, transcription)
+        else:
+            # --------------------------
+            # Step 1: Inline bytes for short recordings, otherwise upload
+            # (an upload is reused if a previous attempt already made it)
+            # --------------------------
+            if size <= INLINE_MAX_BYTES:
+                transfer = "inline"
+                audio_mime = (mime_type or "audio/mpeg") if is_buffer else guess_audio_mime_type(upload_path)
+                audio_file = _inline_part(upload_path, audio_mime)
+            else:
+                transfer = "upload"
+                try:
+                    audio_file = get_or_upload(client, upload_path, **upload_kwargs)
+                except Exception as e:
+                    raise RuntimeError(f"Audio upload failed: {e}")
+
+            # --------------------------
+            # Steps 2-4: Transcription, Summary, Insights
+            # --------------------------
+            if single_call:
+                transcription, summary, parsed_json = _structured_transcription(client, audio_file)
+            else:
+                transcription, summary, parsed_json = _transcribe_and_summarize(client, audio_file)
+
+        if key:
+            put_cached(key, transcription, summary, parsed_json, MODEL_NAME, _prompt_version(single_call))
+
+        # --------------------------
+        # Cleanup (failed attempts keep the upload for a retry;
+        # genai_clients.cleanup_uploads removes those at the end of the run)
+        # --------------------------
+        if transfer == "upload":
+            release_upload(client, upload_path)
+        if upload_path != audio_path:
+            discard_preprocessed(upload_path)
+    _record_transfer(transfer, size)
+
     try:
-        save_to_mongo(s_id, transcription, summary, parsed_json)
+        with timer("excel"):
+            excel_bytes = json_to_excel_bytes(parsed_json)
     except Exception as e:
-        print(f"❌ MongoDB save error: {e}")
+        raise RuntimeError(f"Excel generation failed: {e}")
 
     # --------------------------
-    # Step 6: Cleanup
+    # Step 5: Save to MongoDB
     # --------------------------
     try:
-        client.files.delete(name=audio_file.name)
-    except Exception:
-        pass
+        save_to_mongo(s_id, transcription, summary, parsed_json)
+    except Exception as e:
+        print(f"❌ MongoDB save error: {e}")
 
     # --------------------------
     # Step 7: Return results
@@ -170,7 +422,10 @@ def process_audio_file(audio_path: str, s_id: str = None, api_key: str = None) -
     return {
         "transcription": transcription,
         "summary": summary,
-        "excel_bytes": excel_bytes
+        "excel_bytes": excel_bytes,
+        "insights": parsed_json,
+        "cached": bool(cached),
+        "transfer": transfer
     }
 
 # ---------------------------------------------
@@ -0,0 +1,143 @@
+import os
+import atexit
+import threading
+from google import genai
+from metrics import record_bytes, timer
+
+# ---------------------------------------------
+# Client Registry
+# ---------------------------------------------
+# Environment variables checked for the Gemini API key, in order.
+API_KEY_ENV_VARS = ("GENAI_API_KEY", "GEMINI_API_KEY", "GOOGLE_API_KEY", "API_KEY", "GENI_API_KEY")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def resolve_api_key(api_key: str = None) -> str:
+    """
+    Return `api_key` or the first key found in API_KEY_ENV_VARS.
+
+    Raises:
+        ValueError: If no key is configured.
+    """
+    for candidate in (api_key, *(os.getenv(name) for name in API_KEY_ENV_VARS)):
+        if candidate:
+            return candidate
+    raise ValueError("❌ Gemini API key not found. Please set it in environment variables or pass it explicitly.")
+
+
+def get_client(api_key: str = None):
+    """
+    Return the process-wide genai.Client for this API key, creating it on first use.
+    """
+    key = resolve_api_key(api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = genai.Client(api_key=key)
+            _clients[key] = client
+        return client
+
+
+def set_client(client, api_key: str = None):
+    """
+    Register a ready-made client (e.g. a stub) for `api_key`, or the configured key.
+    """
+    key = resolve_api_key(api_key)
+    with _clients_lock:
+        _clients[key] = client
+
+
+# ---------------------------------------------
+# Upload Handle Cache
+# ---------------------------------------------
+_uploads = {}
+_uploads_lock = threading.Lock()
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def _upload_key(client, source):
+    if not _is_path(source):
+        # An open buffer (e.g. a streamed recording) is identified by the object itself
+        return (id(client), "stream", id(source))
+    stat = os.stat(source)
+    return (id(client), os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+
+
+def source_size(source) -> int:
+    """
+    Size in bytes of a file path or seekable file object, leaving its position unchanged.
+    """
+    if _is_path(source):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def get_or_upload(client, path, **upload_kwargs):
+    """
+    Upload `path` through `client.files.upload` once and reuse the handle afterwards,
+    so a retry after a failed generation step does not upload the same audio again.
+    The cache key includes size and mtime, so a rewritten file is uploaded fresh.
+
+    `path` may also be a seekable binary file object; pass config={"mime_type": ...} with it.
+    """
+    key = _upload_key(client, path)
+    with _uploads_lock:
+        entry = _uploads.get(key)
+    if entry is not None:
+        return entry[1]
+    if not _is_path(path):
+        path.seek(0)
+    with timer("gemini_upload"):
+        handle = client.files.upload(file=path, **upload_kwargs)
+    record_bytes("gemini_upload", source_size(path))
+    with _uploads_lock:
+        _uploads[key] = (client, handle)
+    return handle
+
+
+def release_upload(client, path):
+    """
+    Delete the uploaded copy of `path` (if any) and forget its handle.
+    """
+    try:
+        key = _upload_key(client, path)
+    except OSError:
+        return
+    with _uploads_lock:
+        entry = _uploads.pop(key, None)
+    if entry is not None:
+        _delete_quietly(*entry)
+
+
+def cleanup_uploads() -> int:
+    """
+    Delete every uploaded file still held in the cache. Called at the end of a run
+    and automatically at interpreter exit.
+
+    Returns:
+        int: Number of uploads released.
+    """
+    with _uploads_lock:
+        entries = list(_uploads.values())
+        _uploads.clear()
+    for entry in entries:
+        _delete_quietly(*entry)
+    return len(entries)
+
+
+def _delete_quietly(client, handle):
+    try:
+        client.files.delete(name=handle.name)
+    except Exception:
+        pass
+
+
+atexit.register(cleanup_uploads)
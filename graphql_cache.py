@@ -0,0 +1,386 @@
+import os
+import re
+import json
+import time
+import hashlib
+import requests
+from datetime import datetime, timedelta, timezone
+
+from metrics import record_bytes, timer
+
+# =====================================================
+# CONFIGURATION
+# =====================================================
+
+CACHE_DIR = os.getenv("GRAPHQL_CACHE_DIR", ".graphql_cache")
+# Ranges that were still open when fetched (recent calls may still arrive) expire quickly;
+# ranges that had closed a day before the fetch are treated as settled history.
+CACHE_TTL_SECONDS = int(os.getenv("GRAPHQL_CACHE_TTL", str(3600)))
+HISTORICAL_TTL_SECONDS = int(os.getenv("GRAPHQL_CACHE_HISTORICAL_TTL", str(7 * 24 * 3600)))
+SETTLE_SECONDS = 24 * 3600
+# Two cached ranges closer than this are treated as contiguous.
+CONTIGUITY_SECONDS = 1.0
+# Date-only bounds (YYYY-MM-DD, MM/DD/YYYY) are whole days in this UTC offset. Our day
+# ranges are IST days, e.g. 2025-10-02 runs from 2025-10-01T18:30:00.000Z.
+DATE_ONLY_UTC_OFFSET_MINUTES = int(os.getenv("GRAPHQL_DATE_UTC_OFFSET_MINUTES", "330"))
+
+CALL_DATA_QUERY = """
+query GetEntityByHid {{
+    getCallDataTranscribe(
+        fromDate: "{from_date}"
+        toDate: "{to_date}"{page_args}
+    ) {{
+        s3Uploaded
+        entityId
+        callId
+        entityName
+        state
+        phone
+        city
+        country
+        status
+        description
+        securityDeposit
+        minRent
+        maxRent
+        ownerName
+        email
+        startedYear
+        fullTimeWarden
+        visitorsAllowed
+        website
+        entityType
+        totalBeds
+        Recordings {{
+            s3Url
+            dateCreatedInUpdates
+        }}
+    }}
+}}
+"""
+
+# =====================================================
+# HELPERS
+# =====================================================
+
+def parse_range_bound(date_str, end_of_day=False):
+    """
+    Convert a fromDate/toDate string to a UTC epoch timestamp.
+    Accepts ISO 8601 (with or without Z), YYYY-MM-DD and MM/DD/YYYY.
+    Date-only values cover the whole day in DATE_ONLY_UTC_OFFSET_MINUTES (IST by default).
+    """
+    s = date_str.strip()
+    if re.match(r"^\d{4}-\d{2}-\d{2}$", s):
+        dt = datetime.strptime(s, "%Y-%m-%d")
+    elif re.match(r"^\d{2}/\d{2}/\d{4}$", s):
+        dt = datetime.strptime(s, "%m/%d/%Y")
+    else:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc).timestamp()
+    ts = dt.replace(tzinfo=timezone(timedelta(minutes=DATE_ONLY_UTC_OFFSET_MINUTES))).timestamp()
+    return ts + 86400 - 0.001 if end_of_day else ts
+
+
+def format_iso_utc(ts):
+    """
+    Format a UTC epoch timestamp as ISO 8601 with milliseconds and a Z suffix.
+    """
+    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def recording_timestamp(recording: dict):
+    """
+    Epoch timestamp of a Recording's dateCreatedInUpdates, or None if it is missing or unparseable.
+    """
+    date_str = recording.get("dateCreatedInUpdates")
+    if not date_str:
+        return None
+    try:
+        return parse_range_bound(date_str)
+    except ValueError:
+        return None
+
+
+def _shape_key(url, query_template):
+    """
+    Hash of endpoint + query text with whitespace collapsed, so queries that differ
+    only in their date arguments share a cache namespace.
+    """
+    normalized = " ".join(query_template.split())
+    return hashlib.sha256(f"{url}\n{normalized}".encode("utf-8")).hexdigest()[:16]
+
+
+def _entry_path(cache_dir, shape, start, end):
+    name = "all" if start is None else f"{int(start * 1000)}_{int(end * 1000)}"
+    return os.path.join(cache_dir, shape, f"{name}.json")
+
+
+def _is_fresh(entry, now):
+    end = entry.get("end")
+    settled = end is not None and end <= entry["fetched_at"] - SETTLE_SECONDS
+    ttl = HISTORICAL_TTL_SECONDS if settled else CACHE_TTL_SECONDS
+    return now - entry["fetched_at"] <= ttl
+
+
+def _load_entries(cache_dir, shape):
+    folder = os.path.join(cache_dir, shape)
+    if not os.path.isdir(folder):
+        return []
+    entries = []
+    for filename in os.listdir(folder):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(folder, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["_path"] = path
+            entries.append(entry)
+        except (OSError, ValueError):
+            continue
+    return entries
+
+
+def _store(cache_dir, shape, start, end, records):
+    path = _entry_path(cache_dir, shape, start, end)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    entry = {"start": start, "end": end, "fetched_at": time.time(), "records": records}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def _post(url, query, timeout=60):
+    """
+    Send a GraphQL query and return the getCallDataTranscribe list.
+    Raises requests.HTTPError on non-2xx responses and RuntimeError on GraphQL
+    errors, so failed responses are never cached.
+    """
+    with timer("graphql"):
+        response = requests.post(url, json={"query": query}, headers={"Content-Type": "application/json"},
+                                  timeout=timeout)
+    record_bytes("graphql", len(response.content))
+    response.raise_for_status()
+    data = response.json()
+    if data.get("errors") and not data.get("data"):
+        raise RuntimeError(f"GraphQL errors: {data['errors']}")
+    return (data.get("data") or {}).get("getCallDataTranscribe", []) or []
+
+
+# Argument pairs (page size, offset) that getCallDataTranscribe may accept.
+PAGINATION_ARG_PAIRS = [("limit", "offset"), ("first", "skip"), ("take", "skip")]
+_pagination_support = {}
+
+
+def detect_pagination_args(url: str):
+    """
+    Ask the schema (via introspection) whether getCallDataTranscribe takes
+    page-size/offset arguments. Returns e.g. ("limit", "offset"), or None when the
+    field has no such arguments or introspection is unavailable. Cached per URL.
+    """
+    if url in _pagination_support:
+        return _pagination_support[url]
+    query = "{ __schema { queryType { fields { name args { name } } } } }"
+    found = None
+    try:
+        response = requests.post(url, json={"query": query}, headers={"Content-Type": "application/json"},
+                                 timeout=30)
+        response.raise_for_status()
+        fields = (((response.json().get("data") or {}).get("__schema") or {}).get("queryType") or {}).get("fields") or []
+        for field in fields:
+            if field.get("name") != "getCallDataTranscribe":
+                continue
+            arg_names = {arg.get("name") for arg in field.get("args") or []}
+            for size_arg, offset_arg in PAGINATION_ARG_PAIRS:
+                if size_arg in arg_names and offset_arg in arg_names:
+                    found = (size_arg, offset_arg)
+                    break
+    except Exception as e:
+        print(f"⚠️ Schema introspection unavailable, paging by time window: {e}")
+    _pagination_support[url] = found
+    return found
+
+
+def _render(query_template, from_date, to_date, page_args=""):
+    # Templates without a {page_args} placeholder simply ignore it
+    return query_template.format(from_date=from_date, to_date=to_date, page_args=page_args)
+
+
+def fetch_call_data_page(url: str, from_date: str, to_date: str, offset: int, page_size: int,
+                         pagination_args, query_template: str = CALL_DATA_QUERY):
+    """
+    Fetch one server-side page (bypasses the cache). `pagination_args` is the pair
+    returned by detect_pagination_args; the page arguments are rendered into the
+    template's {page_args} placeholder, right after toDate.
+
+    Raises:
+        ValueError: If `query_template` has no {page_args} placeholder.
+    """
+    if "{page_args}" not in query_template:
+        raise ValueError("query_template needs a {page_args} placeholder for server-side paging")
+    size_arg, offset_arg = pagination_args
+    page_args = f"\n        {size_arg}: {int(page_size)}\n        {offset_arg}: {int(offset)}"
+    return _post(url, _render(query_template, from_date, to_date, page_args))
+
+
+def merge_records(pieces):
+    """
+    Concatenate record lists from adjacent ranges; a callId present in several
+    pieces is kept once with its Recordings merged by s3Url.
+    """
+    merged = {}
+    order = []
+    for records in pieces:
+        for record in records:
+            call_id = record.get("callId")
+            if call_id is None:
+                order.append(record)
+                continue
+            if call_id not in merged:
+                merged[call_id] = dict(record)
+                order.append(merged[call_id])
+                continue
+            existing = merged[call_id]
+            seen = {rec.get("s3Url") for rec in existing.get("Recordings") or []}
+            extra = [rec for rec in record.get("Recordings") or [] if rec.get("s3Url") not in seen]
+            if extra:
+                existing["Recordings"] = list(existing.get("Recordings") or []) + extra
+    return order
+
+
+def _plan(entries, start, end):
+    """
+    Cover [start, end] with cached entries lying inside it.
+    Returns (pieces, gaps): cached entries in order and the uncovered (start, end) ranges.
+    """
+    inside = sorted(
+        (e for e in entries if e.get("start") is not None and e["start"] >= start and e["end"] <= end),
+        key=lambda e: (e["start"], -e["end"]),
+    )
+    pieces, gaps = [], []
+    cursor = start
+    for entry in inside:
+        if entry["end"] <= cursor:
+            continue
+        if entry["start"] > cursor + CONTIGUITY_SECONDS:
+            gaps.append((cursor, entry["start"] - 0.001))
+        pieces.append(entry)
+        cursor = entry["end"] + 0.001
+    if cursor < end - CONTIGUITY_SECONDS:
+        gaps.append((cursor, end))
+    return pieces, gaps
+
+# =====================================================
+# PUBLIC API
+# =====================================================
+
+def fetch_call_data(url: str, from_date: str = None, to_date: str = None,
+                    query_template: str = CALL_DATA_QUERY, use_cache: bool = True,
+                    cache_dir: str = CACHE_DIR):
+    """
+    Fetch getCallDataTranscribe records through the shared on-disk cache.
+
+    The cache is keyed by endpoint + query shape and by date range. A range that
+    is cached, or tiled by cached sub-ranges, is served locally; only the
+    uncovered gaps are requested from the server and cached in turn.
+
+    Args:
+        url (str): GraphQL endpoint URL.
+        from_date (str, optional): Start of the range (ISO 8601, YYYY-MM-DD or MM/DD/YYYY).
+        to_date (str, optional): End of the range, same formats.
+        query_template (str): str.format template with {from_date}/{to_date}
+            placeholders, optionally {page_args} (literal braces doubled).
+            Templates without date placeholders are cached as a single un-ranged entry.
+        use_cache (bool): Set False to always hit the network (the result is still stored).
+        cache_dir (str): Cache folder.
+
+    Returns:
+        list: Call data dictionaries.
+
+    Raises:
+        requests.RequestException: If a network request fails.
+    """
+    shape = _shape_key(url, query_template)
+    ranged = from_date is not None and to_date is not None and "{from_date}" in query_template
+
+    if not ranged:
+        entries = _load_entries(cache_dir, shape) if use_cache else []
+        now = time.time()
+        for entry in entries:
+            if entry.get("start") is None and _is_fresh(entry, now):
+                return entry["records"]
+        records = _post(url, _render(query_template, from_date, to_date))
+        _store(cache_dir, shape, None, None, records)
+        return records
+
+    # Every request uses the normalized bounds, so a date-only or offset-suffixed
+    # argument asks the server for exactly the range that gets cached under it
+    # (a date-only day is an IST day, see DATE_ONLY_UTC_OFFSET_MINUTES).
+    start = parse_range_bound(from_date)
+    end = parse_range_bound(to_date, end_of_day=True)
+    from_date, to_date = format_iso_utc(start), format_iso_utc(end)
+
+    now = time.time()
+    entries = [e for e in _load_entries(cache_dir, shape) if _is_fresh(e, now)] if use_cache else []
+    for entry in entries:
+        if entry.get("start") == start and entry.get("end") == end:
+            return entry["records"]
+
+    pieces, gaps = _plan(entries, start, end)
+    if not pieces:
+        # Nothing reusable: one request for the whole range.
+        records = _post(url, _render(query_template, from_date, to_date))
+        _store(cache_dir, shape, start, end, records)
+        return records
+
+    fetched = []
+    for gap_start, gap_end in gaps:
+        records = _post(url, _render(query_template, format_iso_utc(gap_start), format_iso_utc(gap_end)))
+        _store(cache_dir, shape, gap_start, gap_end, records)
+        fetched.append({"start": gap_start, "end": gap_end, "records": records})
+
+    if not gaps:
+        print(f"💾 Served {from_date} → {to_date} from {len(pieces)} cached range(s)")
+    ordered = sorted(pieces + fetched, key=lambda e: e["start"])
+    return merge_records(e["records"] for e in ordered)
+
+
+def invalidate_cache(from_date: str = None, to_date: str = None, cache_dir: str = CACHE_DIR) -> int:
+    """
+    Remove cached responses overlapping [from_date, to_date] for every query shape.
+    With no dates, everything (including un-ranged entries) is removed.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    start = parse_range_bound(from_date) if from_date else None
+    end = parse_range_bound(to_date, end_of_day=True) if to_date else None
+    removed = 0
+    for shape in os.listdir(cache_dir):
+        for entry in _load_entries(cache_dir, shape):
+            if start is not None or end is not None:
+                if entry.get("start") is None:
+                    continue
+                if start is not None and entry["end"] < start:
+                    continue
+                if end is not None and entry["start"] > end:
+                    continue
+            try:
+                os.unlink(entry["_path"])
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def clear_cache(cache_dir: str = CACHE_DIR) -> int:
+    """
+    Remove every cached response.
+    """
+    return invalidate_cache(cache_dir=cache_dir)
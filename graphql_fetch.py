@@ -1,15 +1,162 @@
 import requests
 import json
+import queue
+import threading
+from contextlib import closing
+from itertools import islice
 from datetime import datetime
+from graphql_cache import (
+    detect_pagination_args,
+    fetch_call_data,
+    fetch_call_data_page,
+    format_iso_utc,
+    parse_range_bound,
+)
 
 # Automatically get today's date in MM/DD/YYYY format
 Specific_date = datetime.now().strftime("%m/%d/%Y")
 
+_PAGES_DONE = object()
+
+
+def _iter_windows(from_date, to_date, window_hours):
+    """
+    Split [from_date, to_date] into consecutive windows of `window_hours`.
+    A range that fits in one window keeps the caller's own date strings.
+    """
+    start = parse_range_bound(from_date)
+    end = parse_range_bound(to_date, end_of_day=True)
+    step = window_hours * 3600
+    if end - start <= step:
+        yield from_date, to_date
+        return
+    cursor = start
+    while cursor <= end:
+        window_end = min(cursor + step - 0.001, end)
+        yield format_iso_utc(cursor), format_iso_utc(window_end)
+        cursor = window_end + 0.001
+
+
+def _produce_pages(url, from_date, to_date, page_size, window_hours, use_cache):
+    pagination_args = detect_pagination_args(url)
+    if pagination_args:
+        offset = 0
+        while True:
+            page = fetch_call_data_page(url, from_date, to_date, offset, page_size, pagination_args)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            offset += page_size
+    else:
+        for window_from, window_to in _iter_windows(from_date, to_date, window_hours):
+            yield fetch_call_data(url, window_from, window_to, use_cache=use_cache)
+
+
+def iter_call_data_pages(
+    url: str = "https://42fd29e5b225.ngrok-free.app/graphql",
+    from_date: str = Specific_date,
+    to_date: str = Specific_date,
+    page_size: int = 100,
+    window_hours: int = 24,
+    prefetch: int = 2,
+    use_cache: bool = True
+):
+    """
+    Yield getCallDataTranscribe results one page (list of records) at a time.
+
+    Uses server-side limit/offset paging when the schema exposes it and otherwise
+    splits the date range into `window_hours` windows (each cached by graphql_cache).
+    Up to `prefetch` pages are fetched ahead on a background thread, so callers can
+    start work on the first page while later pages are still in flight. Closing the
+    generator early stops further requests.
+
+    Args:
+        url (str): GraphQL endpoint URL.
+        from_date (str): Start of the range (ISO 8601, YYYY-MM-DD or MM/DD/YYYY).
+        to_date (str): End of the range, same formats.
+        page_size (int): Records per request when the server supports paging.
+        window_hours (int): Window length when paging by time.
+        prefetch (int): Pages fetched ahead of the consumer.
+        use_cache (bool): Serve time windows from the shared graphql_cache store.
+
+    Yields:
+        list: Call data dictionaries for one page.
+
+    Raises:
+        requests.RequestException: If fetching a page fails.
+    """
+    pages = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def _put(item):
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _producer():
+        try:
+            for page in _produce_pages(url, from_date, to_date, page_size, window_hours, use_cache):
+                if not _put(page):
+                    return
+            _put(_PAGES_DONE)
+        except Exception as e:
+            _put(e)
+
+    worker = threading.Thread(target=_producer, name="graphql-pager", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is _PAGES_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def iter_call_data_transcribe(*args, **kwargs):
+    """
+    Yield call data records one at a time from iter_call_data_pages (same arguments).
+
+    A callId that comes back on a later page (a call with recordings on both sides
+    of a window or page boundary) is yielded again carrying only the Recordings not
+    seen yet, by s3Url, so no recording is lost; a repeat with nothing new is skipped.
+    This is the streaming counterpart of graphql_cache.merge_records.
+    """
+    seen = {}
+    for page in iter_call_data_pages(*args, **kwargs):
+        for record in page:
+            call_id = record.get("callId")
+            if call_id is None:
+                yield record
+                continue
+            recordings = record.get("Recordings") or []
+            urls = seen.get(call_id)
+            if urls is None:
+                seen[call_id] = {rec.get("s3Url") for rec in recordings}
+                yield record
+                continue
+            extra = [rec for rec in recordings if rec.get("s3Url") not in urls]
+            if not extra:
+                continue
+            urls.update(rec.get("s3Url") for rec in extra)
+            yield dict(record, Recordings=extra)
+
+
 def fetch_call_data_transcribe(
     url: str = "https://42fd29e5b225.ngrok-free.app/graphql",
     from_date: str =Specific_date,
     to_date: str = Specific_date,
-    limit: int = 10
+    limit: int = 10,
+    use_cache: bool = True
 ):
     """
     Fetch call transcription data from GraphQL endpoint within a given date range.
@@ -19,62 +166,20 @@ def fetch_call_data_transcribe(
         from_date (str): Start date in ISO 8601 format.
         to_date (str): End date in ISO 8601 format.
         limit (int): Limit number of records to return.
+        use_cache (bool): Serve from / refresh the shared graphql_cache store.
 
     Returns:
         list: List of call transcription data dictionaries (limited by `limit`).
     """
 
-    # --- GraphQL query ---
-    query = f"""
-    query GetEntityByHid {{
-        getCallDataTranscribe(
-            fromDate: "{from_date}"
-            toDate: "{to_date}"
-        ) {{
-            s3Uploaded
-            entityId
-            callId
-            entityName
-            state
-            phone
-            city
-            country
-            status
-            description
-            securityDeposit
-            minRent
-            maxRent
-            ownerName
-            email
-            startedYear
-            fullTimeWarden
-            visitorsAllowed
-            website
-            entityType
-            totalBeds
-            Recordings {{
-                s3Url
-                dateCreatedInUpdates
-            }}
-        }}
-    }}
-    """
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-
     try:
-        response = requests.post(url, json={"query": query}, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-            call_data = data.get("data", {}).get("getCallDataTranscribe", [])
-            return call_data[:limit]
-        else:
-            print(f"❌ Failed! Status code: {response.status_code}")
-            print(response.text)
-            return []
+        # Stop requesting pages as soon as `limit` records have arrived
+        with closing(iter_call_data_transcribe(url, from_date, to_date, use_cache=use_cache)) as records:
+            return list(islice(records, limit))
+    except requests.HTTPError as e:
+        print(f"❌ Failed! Status code: {e.response.status_code}")
+        print(e.response.text)
+        return []
     except Exception as e:
         print(f"⚠️ Error occurred: {e}")
         return []
@@ -0,0 +1,196 @@
+import os
+import time
+import sqlite3
+import threading
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+LEDGER_PATH = os.getenv("JOB_LEDGER_PATH", "job_ledger.sqlite3")
+
+# Per-call stages, in pipeline order
+STAGES = ("fetched", "downloaded", "transcribed", "reconciled", "compared")
+
+DONE = "done"
+FAILED = "failed"
+
+
+# ---------------------------------------------
+# Ledger
+# ---------------------------------------------
+class JobLedger:
+    """
+    SQLite-backed record of which stages each callId has completed.
+
+    One row per (call_id, stage) holds the status ("done" or "failed"), the
+    attempt count, the last error and when it was updated. A re-triggered run
+    asks next_stage() for each call and only does the missing work. Writes are
+    committed immediately, so a crash loses at most the stage in flight.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS call_stages (
+                    call_id    TEXT NOT NULL,
+                    stage      TEXT NOT NULL,
+                    status     TEXT NOT NULL,
+                    attempts   INTEGER NOT NULL DEFAULT 1,
+                    error      TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (call_id, stage)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ledger_meta (
+                    key        TEXT PRIMARY KEY,
+                    value      TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def mark(self, call_id: str, stage: str, status: str = DONE, error: str = None):
+        """
+        Record the outcome of `stage` for `call_id`. A repeated stage bumps its attempt count.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO call_stages (call_id, stage, status, error, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (call_id, stage) DO UPDATE SET
+                    status = excluded.status,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at,
+                    attempts = call_stages.attempts + 1
+                """,
+                (call_id, stage, status, error, time.time()),
+            )
+
+    def mark_failed(self, call_id: str, stage: str, error):
+        self.mark(call_id, stage, FAILED, str(error))
+
+    def completed_stages(self, call_id: str) -> set:
+        """
+        Stages `call_id` has finished successfully.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage FROM call_stages WHERE call_id = ? AND status = ?", (call_id, DONE)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def attempts(self, call_id: str, stage: str) -> int:
+        """
+        How many times `stage` has been recorded for `call_id` (0 if never).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM call_stages WHERE call_id = ? AND stage = ?", (call_id, stage)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def completed_at(self, call_id: str, stage: str):
+        """
+        Epoch time `call_id` last finished `stage`, or None if it has not.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM call_stages WHERE call_id = ? AND stage = ? AND status = ?",
+                (call_id, stage, DONE),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, call_id: str, stage: str) -> bool:
+        return stage in self.completed_stages(call_id)
+
+    def next_stage(self, call_id: str):
+        """
+        First stage `call_id` still needs, or None when every stage is done.
+        """
+        done = self.completed_stages(call_id)
+        return next((stage for stage in STAGES if stage not in done), None)
+
+    def calls(self, stage: str, status: str = DONE) -> list:
+        """
+        callIds whose `stage` has the given status, e.g. every failed download.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_id FROM call_stages WHERE stage = ? AND status = ? ORDER BY updated_at",
+                (stage, status),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def summary(self) -> dict:
+        """
+        {stage: {status: count}} across every call in the ledger.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, COUNT(*) FROM call_stages GROUP BY stage, status"
+            ).fetchall()
+        counts = {stage: {} for stage in STAGES}
+        for stage, status, count in rows:
+            counts.setdefault(stage, {})[status] = count
+        return counts
+
+    # --- key/value state (e.g. the polling watermark) ---
+    def get_value(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM ledger_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_value(self, key: str, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO ledger_meta (key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                (key, None if value is None else str(value), time.time()),
+            )
+
+    def get_watermark(self, name: str = "dateCreatedInUpdates"):
+        """
+        Stored high watermark (an ISO 8601 string), or None before the first poll.
+        """
+        return self.get_value(f"watermark:{name}")
+
+    def advance_watermark(self, value: str, name: str = "dateCreatedInUpdates", key=None) -> str:
+        """
+        Move the watermark forward to `value`; an older value is ignored.
+        `key` turns the stored string into something comparable (default: the string itself).
+        Returns the watermark now stored.
+        """
+        key = key or (lambda v: v)
+        current = self.get_watermark(name)
+        if value is not None and (current is None or key(value) > key(current)):
+            self.set_value(f"watermark:{name}", value)
+            return value
+        return current
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    ledger = JobLedger()
+    for stage, counts in ledger.summary().items():
+        print(f"{stage:<12} {counts}")
@@ -1,37 +1,40 @@
-from download_recordings import download_files,extract_s3_urls_with_callid
-from graphql_fetch import fetch_call_data_transcribe
-from creating_reference_excel import process_s_id
-from compare import mongo_insert
 import os
-from gemini_processing import process_audio_file  # import your existing function
+from pipeline import run_pipeline
+from job_ledger import JobLedger
+from genai_clients import cleanup_uploads
+from mongo_pool import flush_all_writers
+from metrics import export_metrics, print_stage_summary
 
 
 
-"""data downloaded from graphql endpoint"""
-result = fetch_call_data_transcribe("https://42fd29e5b225.ngrok-free.app/graphql")
-
-    
-url_pairs = extract_s3_urls_with_callid(result)
-download_files(url_pairs=url_pairs, download_dir="downloads")
-"""processing each audio file and inserting into mongo the with s_id as filename"""
-folder = "downloads"
+"""
+    Fetch call data from the GraphQL endpoint, download each recording, process it
+    with Gemini (saved to Mongo with the s_id as filename), match it with the GraphQL
+    entity and compare the two. Stages overlap: the first recording can be compared
+    while later ones are still downloading.
 
-for filename in os.listdir(folder):
-    process_audio_file(os.path.join(folder, filename),s_id=filename.split(".")[0])
+    Concurrency per stage: DOWNLOAD_WORKERS, GEMINI_WORKERS (under GEMINI_RPM),
+    COMPARE_WORKERS; queue depth between stages: PIPELINE_QUEUE_SIZE.
 
-"""
-    Given an s_id, fetch corresponding MongoDB record,
-    match it with GraphQL call data, and export both
-    to a structured Excel file.
+    Per-call progress is kept in the job ledger (JOB_LEDGER_PATH), so a re-run
+    only does the stages that are still missing. JOB_LEDGER=0 starts from scratch.
 
-    Args:
-        s_id (str): The unique identifier to process.
+    Stage timings, bytes and Gemini token usage are written to METRICS_PATH at the
+    end (run_metrics.json; a .prom path gives a Prometheus textfile).
     """
-import os
-folder = "downloads"
-for filename in os.listdir(folder):
-    lst=[]
-    lst.append(filename.split(".")[0])
-    for i in lst:
-        process_s_id(i)
-        mongo_insert(f"combined.xlsx")
\ No newline at end of file
+ledger = JobLedger() if os.getenv("JOB_LEDGER", "1") != "0" else None
+report = run_pipeline(
+    "https://42fd29e5b225.ngrok-free.app/graphql",
+    limit=10,
+    download_dir="downloads",
+    # Also write combined_<s_id>.xlsx for each reconciled call
+    export_excel=os.getenv("EXPORT_COMBINED_EXCEL", "0") == "1",
+    ledger=ledger,
+)
+
+# Write out buffered comparison upserts and delete any Gemini uploads left behind by failed attempts
+flush_all_writers()
+cleanup_uploads()
+
+print_stage_summary()
+export_metrics()
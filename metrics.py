@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+# Written by export_metrics(); a .prom path gives a Prometheus textfile, anything else JSON
+METRICS_PATH = os.getenv("METRICS_PATH", "run_metrics.json")
+# Per-call entries kept for the JSON export (aggregates are always complete)
+METRICS_MAX_CALLS = int(os.getenv("METRICS_MAX_CALLS", "10000"))
+METRICS_PREFIX = "aud2ins_"
+
+# Seconds; covers a 50 ms Mongo flush up to a 10 min chunked transcription
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+# usage_metadata attribute → token kind
+USAGE_FIELDS = {
+    "prompt_token_count": "prompt",
+    "candidates_token_count": "output",
+    "thoughts_token_count": "thoughts",
+    "cached_content_token_count": "cached",
+    "total_token_count": "total",
+}
+
+
+# ---------------------------------------------
+# Histogram
+# ---------------------------------------------
+class Histogram:
+    """
+    Fixed-bucket histogram: count, sum, min, max and cumulative bucket counts.
+    Observing is O(log buckets) with no per-sample storage.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float):
+        """
+        Estimate of the q-quantile: the upper bound of the bucket it falls in
+        (capped at the observed max).
+        """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": cumulative,
+        }
+
+
+# ---------------------------------------------
+# Per-call Scope
+# ---------------------------------------------
+class CallMetrics:
+    """
+    Everything measured while one call (s_id) is processed: seconds per stage,
+    token usage by kind and bytes by kind. Safe to update from chunk worker threads.
+    """
+
+    def __init__(self, s_id: str):
+        self.s_id = s_id
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.stages = {}
+        self.tokens = {}
+        self.bytes = {}
+        self._lock = threading.Lock()
+
+    def add(self, field: str, key: str, value: float):
+        with self._lock:
+            target = getattr(self, field)
+            target[key] = target.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+                "stages": {stage: round(value, 6) for stage, value in self.stages.items()},
+                "tokens": dict(self.tokens),
+                "bytes": dict(self.bytes),
+            }
+
+
+_current_call = contextvars.ContextVar("metrics_current_call", default=None)
+
+
+def current_call():
+    """
+    The CallMetrics of the call being processed in this context, or None.
+    """
+    return _current_call.get()
+
+
+# ---------------------------------------------
+# Registry
+# ---------------------------------------------
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    Process-wide store of labelled histograms and counters, plus the per-call
+    breakdowns recorded through call_scope(). Every update takes one lock.
+    """
+
+    def __init__(self, max_calls: int = METRICS_MAX_CALLS):
+        self.max_calls = max_calls
+        self.started_at = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets=DURATION_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_call(self, call: CallMetrics):
+        with self._lock:
+            if call.s_id in self._calls or len(self._calls) < self.max_calls:
+                self._calls[call.s_id] = call
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._histograms.clear()
+            self._counters.clear()
+            self._calls.clear()
+
+    def snapshot(self) -> dict:
+        """
+        JSON-ready view: {"started_at", "elapsed_seconds", "histograms", "counters", "calls"}.
+        Series are listed as {"labels": {...}, ...values} under their metric name.
+        """
+        with self._lock:
+            histograms = {key: histogram.to_dict() for key, histogram in self._histograms.items()}
+            counters, calls, started_at = dict(self._counters), dict(self._calls), self.started_at
+        report = {
+            "started_at": started_at,
+            "elapsed_seconds": round(time.time() - started_at, 3),
+            "histograms": {},
+            "counters": {},
+            "calls": {s_id: call.to_dict() for s_id, call in calls.items()},
+        }
+        for (name, labels), histogram in sorted(histograms.items()):
+            report["histograms"].setdefault(name, []).append({"labels": dict(labels), **histogram})
+        for (name, labels), value in sorted(counters.items()):
+            report["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return report
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """
+        Prometheus text exposition format (for node_exporter's textfile collector).
+        Per-call entries are left out to keep label cardinality bounded.
+        """
+        with self._lock:
+            histograms = {key: (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+        lines, typed = [], set()
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            running = 0
+            for bound, bucket_count in zip(buckets, counts):
+                running += bucket_count
+                lines.append(f"{metric}_bucket{fmt(labels, [('le', bound)])} {running}")
+            lines.append(f"{metric}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{fmt(labels)} {total}")
+            lines.append(f"{metric}_count{fmt(labels)} {count}")
+        for (name, labels), value in sorted(counters.items()):
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+# ---------------------------------------------
+# Recording
+# ---------------------------------------------
+def observe(name: str, value: float, buckets=DURATION_BUCKETS, **labels):
+    if METRICS_ENABLED:
+        _registry.observe(name, value, buckets, **labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        _registry.inc(name, value, **labels)
+
+
+def record_bytes(kind: str, size: int):
+    """
+    Count `size` bytes of `kind` (e.g. "s3_download", "gemini_upload") globally and for the current call.
+    """
+    if not METRICS_ENABLED or not size:
+        return
+    _registry.inc("bytes_total", size, kind=kind)
+    call = current_call()
+    if call is not None:
+        call.add("bytes", kind, size)
+
+
+@contextmanager
+def timer(stage: str, **labels):
+    """
+    Time the block into the `stage_seconds{stage=...}` histogram (and the current
+    call's stage breakdown). An exception also bumps `stage_errors_total`.
+
+        with metrics.timer("mongo_write"):
+            collection.bulk_write(...)
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        _registry.inc("stage_errors_total", stage=stage, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _registry.observe("stage_seconds", elapsed, stage=stage, **labels)
+        call = current_call()
+        if call is not None:
+            call.add("stages", stage, elapsed)
+
+
+def record_usage(response, stage: str) -> dict:
+    """
+    Add a Gemini response's usage_metadata to `gemini_tokens_total{stage, kind}`
+    and to the current call. Responses without usage metadata count as a request only.
+
+    Returns:
+        dict: {kind: tokens} for this response.
+    """
+    usage = {}
+    metadata = getattr(response, "usage_metadata", None)
+    for attribute, kind in USAGE_FIELDS.items():
+        value = getattr(metadata, attribute, None) if metadata is not None else None
+        if isinstance(value, (int, float)) and value:
+            usage[kind] = value
+    if not METRICS_ENABLED:
+        return usage
+    _registry.inc("gemini_requests_total", stage=stage)
+    call = current_call()
+    for kind, value in usage.items():
+        _registry.inc("gemini_tokens_total", value, stage=stage, kind=kind)
+        if call is not None:
+            call.add("tokens", kind, value)
+    return usage
+
+
+@contextmanager
+def call_scope(s_id: str):
+    """
+    Attribute everything measured inside the block (in this thread, or in threads
+    started with contextvars.copy_context()) to `s_id`. On exit the call's total
+    seconds and tokens go into the `call_seconds` / `call_tokens` histograms.
+    """
+    if not METRICS_ENABLED or current_call() is not None:
+        # Nested scopes (e.g. a retry wrapper around process_audio_file) keep the outer call
+        yield current_call()
+        return
+    call = CallMetrics(s_id or "unknown")
+    token = _current_call.set(call)
+    try:
+        yield call
+    finally:
+        _current_call.reset(token)
+        call.seconds = time.perf_counter() - call.started
+        _registry.observe("call_seconds", call.seconds)
+        total = call.tokens.get("total") or (call.tokens.get("prompt", 0) + call.tokens.get("output", 0))
+        if total:
+            _registry.observe("call_tokens", total, buckets=TOKEN_BUCKETS)
+        _registry.add_call(call)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """
+    executor.submit() that carries the current call scope into the worker thread.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ---------------------------------------------
+# Export
+# ---------------------------------------------
+def snapshot() -> dict:
+    return _registry.snapshot()
+
+
+def reset():
+    _registry.reset()
+
+
+def export_metrics(path: str = None, fmt: str = None) -> str:
+    """
+    Write the run's metrics to `path` (default METRICS_PATH).
+
+    Args:
+        path (str, optional): Output file; written atomically.
+        fmt (str, optional): "json" or "prometheus". Defaults to prometheus for a
+            .prom path and json otherwise.
+
+    Returns:
+        str: The path written, or None when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return None
+    path = path or METRICS_PATH
+    fmt = fmt or ("prometheus" if path.endswith(".prom") else "json")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if fmt == "prometheus":
+            f.write(_registry.to_prometheus())
+        else:
+            json.dump(_registry.snapshot(), f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    print(f"📊 Metrics written to {path}")
+    return path
+
+
+def print_stage_summary(top: int = 12):
+    """
+    Print the slowest stages by total time, to see where a run spent its time.
+    """
+    stages = snapshot()["histograms"].get("stage_seconds", [])
+    if not stages:
+        return
+    print("📊 Time by stage (total / mean / p95 / count):")
+    for series in sorted(stages, key=lambda s: s["sum"], reverse=True)[:top]:
+        label = ",".join(f"{v}" for v in series["labels"].values())
+        print(f"   {label:<28} {series['sum']:>9.2f}s {series['mean']:>7.2f}s "
+              f"{series['p95']:>7.2f}s {series['count']:>6}")
@@ -0,0 +1,371 @@
+import os
+import atexit
+import threading
+from pymongo import InsertOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from metrics import inc, timer
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "15000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "60000"))
+# Buffered writer flush policy: whichever comes first
+MONGO_WRITE_BATCH_SIZE = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "50"))
+MONGO_WRITE_MAX_DELAY = float(os.getenv("MONGO_WRITE_MAX_DELAY", "5"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def default_mongo_uri() -> str:
+    """
+    MongoDB URI from environment variables, falling back to localhost.
+    """
+    return (
+        os.getenv("MONGODB_URI")
+        or os.getenv("MONGO_URI")
+        or "mongodb://localhost:27017/"
+    )
+
+
+# ---------------------------------------------
+# Connection Manager
+# ---------------------------------------------
+def get_mongo_client(uri: str = None) -> MongoClient:
+    """
+    Return the process-wide pooled MongoClient for `uri` (default: default_mongo_uri()),
+    creating it on first use. MongoClient is thread-safe, so every module and worker
+    thread shares the same connection pool instead of paying a new TLS handshake.
+    """
+    uri = uri or default_mongo_uri()
+    with _clients_lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = MongoClient(
+                uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            )
+            _clients[uri] = client
+        return client
+
+
+def get_collection(db_name: str, collection_name: str, uri: str = None):
+    """
+    Shortcut for get_mongo_client(uri)[db_name][collection_name].
+    """
+    return get_mongo_client(uri)[db_name][collection_name]
+
+
+def set_mongo_client(client, uri: str = None):
+    """
+    Register a ready-made client (e.g. an in-memory stand-in) for `uri`.
+    """
+    with _clients_lock:
+        _clients[uri or default_mongo_uri()] = client
+
+
+def close_mongo_clients():
+    """
+    Close every pooled client. Registered to run at interpreter exit.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+# ---------------------------------------------
+# Indexes
+# ---------------------------------------------
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+
+def find_duplicates(collection, field: str = "s_id", limit: int = 10) -> list:
+    """
+    Values of `field` held by more than one document, as [{"_id": value, "count": n}],
+    most duplicated first.
+    """
+    pipeline = [
+        {"$match": {field: {"$exists": True}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+def ensure_unique_index(collection, field: str = "s_id") -> bool:
+    """
+    Create a unique index on `field` once per collection per process.
+
+    The index is partial (only documents that have `field`), so documents written
+    without the key never collide with each other on a null value. If existing
+    duplicates prevent the index, they are reported and False is returned; nothing
+    else is created, and the next process tries again once they are cleaned up.
+    """
+    key = (getattr(collection, "full_name", id(collection)), field)
+    with _indexed_lock:
+        if key in _indexed:
+            return True
+    try:
+        collection.create_index(field, unique=True, partialFilterExpression={field: {"$exists": True}})
+    except PyMongoError as e:
+        name = getattr(collection, "full_name", field)
+        try:
+            duplicates = find_duplicates(collection, field)
+        except PyMongoError:
+            duplicates = []
+        if duplicates:
+            sample = ", ".join(f"{d['_id']!r} ×{d['count']}" for d in duplicates)
+            print(f"❌ No unique index on {name}.{field}: duplicate values exist ({sample}). "
+                  f"Remove the extra documents so upserts by {field} stay one-per-key.")
+        else:
+            print(f"❌ Could not create unique index on {name}.{field}: {e}")
+        return False
+    with _indexed_lock:
+        _indexed.add(key)
+    return True
+
+
+def ensure_index(collection, field: str) -> bool:
+    """
+    Create a plain (non-unique) index on `field` once per collection per process.
+    """
+    key = (getattr(collection, "full_name", id(collection)), field)
+    with _indexed_lock:
+        if key in _indexed:
+            return True
+    try:
+        collection.create_index(field)
+    except PyMongoError as e:
+        print(f"❌ Could not create index on {field}: {e}")
+        return False
+    with _indexed_lock:
+        _indexed.add(key)
+    return True
+
+
+# Collections read by s_id, as (db, collection): indexed field
+INDEXED_COLLECTIONS = {
+    ("audio_processing", "audio_results"): "s_id",
+}
+
+
+def ensure_indexes(uri: str = None):
+    """
+    Bootstrap the s_id indexes the pipeline's lookups rely on. Safe to call often:
+    each index is only created once per process.
+    """
+    for (db_name, collection_name), field in INDEXED_COLLECTIONS.items():
+        ensure_unique_index(get_collection(db_name, collection_name, uri), field)
+
+
+# ---------------------------------------------
+# Batched Lookups
+# ---------------------------------------------
+def find_by_s_ids(collection, s_ids, projection=None, batch_size: int = 500, key: str = "s_id") -> dict:
+    """
+    Fetch documents for many s_ids with `$in` queries of up to `batch_size` ids
+    instead of one find_one per s_id.
+
+    Args:
+        collection: pymongo Collection (or anything with a compatible find()).
+        s_ids (iterable): s_ids to look up.
+        projection (dict | list, optional): Fields to return, e.g. {"transcription": 0}.
+        batch_size (int): Maximum ids per query.
+        key (str): Field the ids are matched against.
+
+    Returns:
+        dict: {s_id: document}. Missing s_ids are absent; if duplicates exist the
+        oldest document (lowest _id) wins, like find_one.
+    """
+    unique_ids = list(dict.fromkeys(s_id for s_id in s_ids if s_id is not None))
+    if projection is not None and isinstance(projection, dict) and 0 not in projection.values():
+        projection = {**projection, key: 1}
+    elif projection is not None and not isinstance(projection, dict):
+        projection = list(dict.fromkeys([*projection, key]))
+
+    found = {}
+    for start in range(0, len(unique_ids), max(1, batch_size)):
+        chunk = unique_ids[start:start + batch_size]
+        cursor = collection.find({key: {"$in": chunk}}, projection).sort("_id", 1)
+        for document in cursor:
+            found.setdefault(document.get(key), document)
+    return found
+
+
+# ---------------------------------------------
+# Buffered Writer
+# ---------------------------------------------
+class BufferedUpsertWriter:
+    """
+    Collects documents and writes them with one bulk_write of upserts keyed by `key`.
+
+    A flush happens when `max_batch` documents are buffered or `max_delay` seconds
+    after the first buffered document, whichever comes first, and on flush()/close().
+    Re-adding a document with the same key replaces the stored one, so re-runs never
+    create duplicates. Documents without the key are inserted as-is (the key field
+    is dropped rather than stored as null).
+
+    Operations the server rejects are logged and dropped; their keys are kept in
+    `failed` ({key value: error message}) until they are added again.
+    """
+
+    def __init__(self, collection, key: str = "s_id", max_batch: int = MONGO_WRITE_BATCH_SIZE,
+                 max_delay: float = MONGO_WRITE_MAX_DELAY):
+        self.collection = collection
+        self.key = key
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._keyed = {}
+        self._unkeyed = []
+        self.failed = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        ensure_unique_index(collection, key)
+
+    def add(self, document: dict):
+        """
+        Buffer a document for upsert.
+        """
+        document = {k: v for k, v in document.items() if k != "_id"}
+        with self._lock:
+            if document.get(self.key) is None:
+                document.pop(self.key, None)
+                self._unkeyed.append(document)
+            else:
+                self._keyed[document[self.key]] = document
+                self.failed.pop(document[self.key], None)
+            pending = len(self._keyed) + len(self._unkeyed)
+            if pending >= self.max_batch:
+                self.flush()
+            elif self._timer is None and self.max_delay > 0:
+                self._timer = threading.Timer(self.max_delay, self._flush_quietly)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def find_pending(self, field: str, value):
+        """
+        Return a copy of a buffered (not yet written) document whose `field` equals
+        `value`, or None. Lets readers see this process's queued writes without
+        forcing a flush.
+        """
+        with self._lock:
+            if field == self.key:
+                document = self._keyed.get(value)
+                return dict(document) if document is not None else None
+            for document in (*self._keyed.values(), *self._unkeyed):
+                if document.get(field) == value:
+                    return dict(document)
+        return None
+
+    def flush(self) -> int:
+        """
+        Write everything buffered in one bulk_write. Returns the number of documents
+        written; rejected ones are logged, recorded in `failed` and not retried.
+        Connection-level errors propagate and leave the buffer intact.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            keys = list(self._keyed)
+            operations = [
+                ReplaceOne({self.key: key_value}, self._keyed[key_value], upsert=True)
+                for key_value in keys
+            ]
+            operations.extend(InsertOne(document) for document in self._unkeyed)
+            if not operations:
+                return 0
+            name = getattr(self.collection, "name", None)
+            rejected = []
+            try:
+                # ordered=False lets the server apply the batch in parallel
+                with timer("mongo_write", collection=name):
+                    self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything except the listed operations was applied
+                rejected = e.details.get("writeErrors", [])
+                for error in rejected:
+                    position = error.get("index", -1)
+                    key_value = keys[position] if 0 <= position < len(keys) else None
+                    if key_value is not None:
+                        self.failed[key_value] = error.get("errmsg", "write error")
+                    print(f"❌ MongoDB rejected {name} document {self.key}={key_value}: {error.get('errmsg')}")
+                inc("mongo_write_errors_total", len(rejected), collection=name)
+            written = len(operations) - len(rejected)
+            inc("mongo_documents_total", written, collection=name)
+            self._keyed.clear()
+            self._unkeyed.clear()
+        return written
+
+    def _flush_quietly(self):
+        try:
+            count = self.flush()
+            if count:
+                print(f"💾 Flushed {count} document(s) to {getattr(self.collection, 'name', 'MongoDB')}")
+        except Exception as e:
+            print(f"❌ Failed to flush buffered MongoDB writes: {e}")
+
+    def close(self):
+        """
+        Flush whatever is left.
+        """
+        self.flush()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_name: str, collection_name: str, uri: str = None, key: str = "s_id") -> BufferedUpsertWriter:
+    """
+    Return the shared BufferedUpsertWriter for a collection, creating it on first use.
+    """
+    writer_key = (uri or default_mongo_uri(), db_name, collection_name, key)
+    with _writers_lock:
+        writer = _writers.get(writer_key)
+        if writer is None:
+            writer = BufferedUpsertWriter(get_collection(db_name, collection_name, uri), key=key)
+            _writers[writer_key] = writer
+        return writer
+
+
+def flush_all_writers() -> int:
+    """
+    Flush every shared writer. Call before reading back data that was just saved.
+    Returns the total number of operations written.
+    """
+    with _writers_lock:
+        writers = list(_writers.values())
+    total = 0
+    for writer in writers:
+        try:
+            total += writer.flush()
+        except Exception as e:
+            print(f"❌ Failed to flush buffered MongoDB writes: {e}")
+    return total
+
+
+def _shutdown():
+    flush_all_writers()
+    with _writers_lock:
+        _writers.clear()
+    close_mongo_clients()
+
+
+atexit.register(_shutdown)
@@ -3,7 +3,39 @@ import pandas as pd
 import ast
 import json
 from io import BytesIO
-from google import genai
+from google.genai import types
+from genai_clients import get_client
+from metrics import record_usage
+
+# Fields we want in the parsed insights
+PARSE_FIELDS = [
+    "Room Type",
+    "Cost",
+    "Desired Location",
+    "Available Location",
+    "Status of Inhabitant",
+    "Required Amenities",
+    "Alternative Suggestions",
+    "RoomDetails.requested_type",
+    "RoomDetails.requested_bathroom_type"
+]
+
+
+def insights_response_schema() -> types.Schema:
+    """
+    Response schema matching what parse_text_to_json produces: one nullable string
+    per PARSE_FIELDS entry, with dotted fields nested under their parent object.
+    """
+    properties = {}
+    for field in PARSE_FIELDS:
+        if "." in field:
+            parent, child = field.split(".", 1)
+            nested = properties.setdefault(parent, types.Schema(type="OBJECT", properties={}, nullable=True))
+            nested.properties[child] = types.Schema(type="STRING", nullable=True)
+        else:
+            properties[field] = types.Schema(type="STRING", nullable=True)
+    return types.Schema(type="OBJECT", properties=properties, required=list(properties))
+
 
 def parse_text_to_json(text: str):
     """
@@ -18,18 +50,7 @@ def parse_text_to_json(text: str):
     Returns:
         dict: Parsed JSON output with only the requested fields.
     """
-    # Fields we want in the output
-    fields = [
-        "Room Type",
-        "Cost",
-        "Desired Location",
-        "Available Location",
-        "Status of Inhabitant",
-        "Required Amenities",
-        "Alternative Suggestions",
-        "RoomDetails.requested_type",
-        "RoomDetails.requested_bathroom_type"
-    ]
+    fields = PARSE_FIELDS
 
     # Construct prompt
     prompt = f"""
@@ -41,13 +62,8 @@ def parse_text_to_json(text: str):
     {text}
     """
 
-    # Get API key
-    api_key = os.getenv("GENAI_API_KEY") or os.getenv("GENI_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("Missing API key. Set GENAI_API_KEY or GEMINI_API_KEY environment variable.")
-
-    # Initialize Gemini client
-    client = genai.Client(api_key=api_key)
+    # Shared Gemini client (API key resolved once per process)
+    client = get_client()
     MODEL_NAME = "gemini-2.5-flash"
 
     # Call Gemini
@@ -55,6 +71,7 @@ def parse_text_to_json(text: str):
         model=MODEL_NAME,
         contents=[prompt]
     )
+    record_usage(response, "parse_insights")
 
     # Clean model output
     clean_text = response.text.strip().strip("```")
@@ -0,0 +1,626 @@
+import os
+import time
+import asyncio
+import statistics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import gemini_processing
+from audio_preprocess import PREPROCESS_ENABLED, PREPROCESS_WORKERS, discard_preprocessed, ffmpeg_path, preprocess_audio
+from audio_pool import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_WORKERS, TokenBucket, count_transfers, requests_per_file
+from compare import COMPARE_BATCH_LINGER_SECONDS, COMPARE_BATCH_MAX_ITEMS, compare_and_store_batch
+from creating_reference_excel import build_call_index, index_by_call_id, reconcile_s_ids, write_combined_excel
+from download_recordings import (
+    clear_directory,
+    create_download_session,
+    download_file_resumable,
+    extract_s3_urls_with_callid,
+    guess_audio_mime_type,
+    stream_recording,
+)
+from graphql_cache import recording_timestamp
+from graphql_fetch import Specific_date, iter_call_data_transcribe
+from job_ledger import JobLedger
+from metrics import inc, observe
+from mongo_pool import flush_all_writers, get_collection
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+COMPARE_WORKERS = int(os.getenv("COMPARE_WORKERS", "2"))
+# Items allowed to wait between two stages before the upstream stage pauses
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+# Stream recordings from S3 straight into the upload instead of through downloads/
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "0") == "1"
+# With STREAM_UPLOADS, also keep a copy in downloads/
+KEEP_LOCAL_COPY = os.getenv("KEEP_LOCAL_COPY", "0") == "1"
+# s_ids reconciled per batched MongoDB lookup
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "20"))
+
+STAGES = ("fetch", "download", "preprocess", "process", "reconcile", "compare")
+# Pipeline stage → job_ledger stage it completes
+LEDGER_STAGES = {
+    "fetch": "fetched",
+    "download": "downloaded",
+    "process": "transcribed",
+    "reconcile": "reconciled",
+    "compare": "compared",
+}
+
+_DONE = object()
+
+
+# ---------------------------------------------
+# Jobs and Reporting
+# ---------------------------------------------
+class PipelineJob:
+    """
+    One recording travelling through the pipeline.
+    """
+
+    def __init__(self, s_id: str, url: str, path: str):
+        self.s_id = s_id
+        self.url = url
+        self.path = path
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stage_seconds = {}
+        self.failed_stage = None
+        self.error = None
+        self.match = None
+        # In-memory/spooled recording when streaming instead of downloading
+        self.buffer = None
+        # How the audio reached the model (process_audio_file's "transfer")
+        self.transfer = None
+        # Ledger stages already completed by an earlier run
+        self.resumed = set()
+        # Recording the downloaded/streamed audio came from, and the one transcribed;
+        # `url` can move on to a later recording of the same call while the job waits
+        self.audio_url = None
+        self.transcribed_url = None
+
+    def to_dict(self) -> dict:
+        return {
+            "s_id": self.s_id,
+            "url": self.url,
+            "path": self.path,
+            "ok": self.failed_stage is None and self.finished is not None,
+            "failed_stage": self.failed_stage,
+            "error": self.error,
+            "latency": (self.finished - self.started) if self.finished else None,
+            "stage_seconds": dict(self.stage_seconds),
+            "transfer": self.transfer,
+            "resumed": sorted(self.resumed),
+        }
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize_jobs(jobs: list, elapsed: float, skipped: int = 0) -> dict:
+    """
+    Throughput and latency figures for a finished run.
+
+    Returns:
+        dict: items, completed, skipped (already compared per the ledger), failed
+        (per stage), elapsed, calls_per_minute, latency (p50/p95/max seconds,
+        fetch → compared) and stage_mean_seconds.
+    """
+    completed = [job for job in jobs if job.failed_stage is None and job.finished is not None]
+    latencies = sorted(job.finished - job.started for job in completed)
+    failed = {}
+    for job in jobs:
+        if job.failed_stage:
+            failed[job.failed_stage] = failed.get(job.failed_stage, 0) + 1
+    stage_means = {}
+    for stage in STAGES:
+        values = [job.stage_seconds[stage] for job in jobs if stage in job.stage_seconds]
+        if values:
+            stage_means[stage] = sum(values) / len(values)
+    return {
+        "items": len(jobs),
+        "completed": len(completed),
+        "skipped": skipped,
+        "failed": failed,
+        "elapsed": elapsed,
+        "calls_per_minute": len(completed) / max(elapsed, 1e-9) * 60,
+        "latency": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "max": latencies[-1] if latencies else None,
+        },
+        "stage_mean_seconds": stage_means,
+        "transfer": count_transfers({"transfer": job.transfer} for job in jobs),
+    }
+
+
+def record_job_metrics(jobs: list):
+    """
+    Feed per-call stage times and end-to-end latency into the metrics registry
+    (pipeline_stage_seconds, pipeline_call_seconds, pipeline_calls_total).
+    """
+    for job in jobs:
+        for stage, seconds in job.stage_seconds.items():
+            observe("pipeline_stage_seconds", seconds, stage=stage)
+        if job.failed_stage:
+            inc("pipeline_calls_total", outcome="failed", stage=job.failed_stage)
+        elif job.finished is not None:
+            observe("pipeline_call_seconds", job.finished - job.started)
+            inc("pipeline_calls_total", outcome="compared")
+
+
+def _print_summary(summary: dict):
+    latency = summary["latency"]
+    print(f"\n🎉 Pipeline finished: {summary['completed']}/{summary['items']} calls compared "
+          f"in {summary['elapsed']:.1f}s ({summary['calls_per_minute']:.1f} calls/min)")
+    if latency["p50"] is not None:
+        print(f"   Latency per call: p50 {latency['p50']:.1f}s, p95 {latency['p95']:.1f}s, max {latency['max']:.1f}s")
+    for stage, seconds in summary["stage_mean_seconds"].items():
+        print(f"   {stage:<10} mean {seconds:.2f}s")
+    if summary.get("transfer"):
+        print("📊 Audio sent: " + ", ".join(f"{kind} {count}" for kind, count in sorted(summary["transfer"].items())))
+    if summary.get("skipped"):
+        print(f"♻️ {summary['skipped']} call(s) already compared in an earlier run were skipped")
+    for stage, count in summary["failed"].items():
+        print(f"⚠️ {count} call(s) failed at {stage}")
+
+
+def has_recording_since_compare(record: dict, ledger: JobLedger) -> bool:
+    """
+    True if `record` carries a recording created (dateCreatedInUpdates) after its
+    call was last compared, so the stored comparison predates it.
+    """
+    compared_at = ledger.completed_at(record.get("callId"), LEDGER_STAGES["compare"])
+    if compared_at is None:
+        return False
+    for recording in record.get("Recordings") or []:
+        ts = recording_timestamp(recording)
+        if ts is not None and ts > compared_at:
+            return True
+    return False
+
+
+def _has_audio_result(s_id: str) -> bool:
+    collection = get_collection("audio_processing", "audio_results")
+    return collection.find_one({"s_id": s_id}, {"_id": 1}) is not None
+
+
+# ---------------------------------------------
+# Pipeline
+# ---------------------------------------------
+class Pipeline:
+    """
+    Streaming fetch → download → process → reconcile → compare pipeline.
+
+    Stages are joined by bounded asyncio queues, so a slow stage makes the ones
+    before it wait (backpressure) instead of piling up work, and each stage runs
+    its own number of workers. The blocking helpers (requests, genai, pymongo)
+    run on a dedicated thread pool sized to the sum of the stage limits.
+
+    With a JobLedger, every stage outcome is recorded per callId. Calls already
+    compared are skipped, downloads and transcriptions from an earlier run are
+    reused, and downloads/ is no longer emptied at the start.
+
+    With stream=True (STREAM_UPLOADS=1) recordings go from their s3Url into a
+    bounded SpooledBuffer and straight into the Gemini upload; nothing is written
+    to downloads/ unless keep_local is set.
+    """
+
+    def __init__(self, url: str, from_date: str = Specific_date, to_date: str = Specific_date,
+                 limit: int = None, download_dir: str = "downloads", call_index: dict = None,
+                 download_workers: int = DOWNLOAD_WORKERS, process_workers: int = DEFAULT_WORKERS,
+                 requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE, compare_workers: int = COMPARE_WORKERS,
+                 compare_batch: int = COMPARE_BATCH_MAX_ITEMS,
+                 compare_linger: float = COMPARE_BATCH_LINGER_SECONDS, reconcile_batch: int = RECONCILE_BATCH_SIZE,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, single_call: bool = None, export_excel: bool = False,
+                 use_cache: bool = True, process_fn=None, compare_fn=None, ledger: JobLedger = None,
+                 records=None, preprocess: bool = None, stream: bool = None, keep_local: bool = None):
+        self.url = url
+        self.from_date = from_date
+        self.to_date = to_date
+        self.limit = limit
+        self.download_dir = download_dir
+        self.call_index = call_index
+        self.workers = {
+            "download": max(1, download_workers),
+            "process": max(1, process_workers),
+            "reconcile": 1,
+            "compare": max(1, compare_workers),
+        }
+        self.compare_batch = max(1, compare_batch)
+        self.compare_linger = max(0.0, compare_linger)
+        self.reconcile_batch = max(1, reconcile_batch)
+        self.queue_size = max(1, queue_size)
+        self.single_call = single_call
+        self.export_excel = export_excel
+        self.use_cache = use_cache
+        self.process_fn = process_fn or gemini_processing.process_audio_file
+        self.compare_fn = compare_fn or compare_and_store_batch
+        self.limiter = TokenBucket(requests_per_minute)
+        self.ledger = ledger
+        # Already-fetched call records to push through instead of querying the date range
+        self.records = records
+        # Zero-disk mode: S3 → SpooledBuffer → files.upload; downloads/ only when keep_local
+        self.stream = STREAM_UPLOADS if stream is None else stream
+        self.keep_local = KEEP_LOCAL_COPY if keep_local is None else keep_local
+        # ffmpeg preprocessing in a process pool before upload (optional dependency; needs a file)
+        self.preprocess = ((PREPROCESS_ENABLED if preprocess is None else preprocess) and not self.stream
+                           and ffmpeg_path() is not None)
+        self.jobs = []
+        self.skipped = 0
+
+    # --- helpers ---
+    async def _call(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    def _done(self, job, stage):
+        if self.ledger is not None:
+            self.ledger.mark(job.s_id, LEDGER_STAGES[stage])
+
+    def _fail(self, job, stage, error):
+        job.failed_stage = stage
+        job.error = str(error)
+        if self.ledger is not None:
+            self.ledger.mark_failed(job.s_id, LEDGER_STAGES[stage], error)
+        print(f"❌ {stage} failed for {job.s_id}: {error}")
+
+    async def _drain(self, inbound, first, size, linger: float = 0.0):
+        """
+        Take `first` plus whatever else is already queued, up to `size` items,
+        waiting up to `linger` seconds for more if the batch is not full.
+        Returns (batch, done) where done means the end marker was seen.
+        """
+        batch, done = [first], False
+        deadline = time.monotonic() + linger
+        while len(batch) < size:
+            try:
+                item = inbound.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(inbound.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is _DONE:
+                done = True
+                break
+            batch.append(item)
+        return batch, done
+
+    async def _run_workers(self, stage, inbound, outbound, worker):
+        """
+        Run the stage's workers until the end marker arrives, then pass it on.
+        """
+        async def _loop():
+            while True:
+                item = await inbound.get()
+                if item is _DONE:
+                    await inbound.put(_DONE)  # let sibling workers see it too
+                    return
+                await worker(item)
+
+        await asyncio.gather(*(_loop() for _ in range(self.workers[stage])))
+        if outbound is not None:
+            await outbound.put(_DONE)
+
+    # --- stages ---
+    async def _fetch(self, outbound):
+        if self.records is not None:
+            records = iter(self.records)
+        else:
+            records = iter_call_data_transcribe(self.url, self.from_date, self.to_date, use_cache=self.use_cache)
+        # {path: job}; a callId seen again keeps its last URL, as download_files_concurrent does
+        queued = {}
+        # Paths of calls the ledger had already compared, counted once in self.skipped
+        skipped = set()
+        try:
+            while self.limit is None or len(self.jobs) < self.limit:
+                started = time.perf_counter()
+                record = await self._call(next, records, None)
+                if record is None:
+                    break
+                self._seen_records.append(record)
+                latest = {}
+                for call_id, url in extract_s3_urls_with_callid(record):
+                    if not call_id:
+                        call_id = f"unknown_{len(self.jobs) + len(latest) + 1}"
+                    latest[os.path.join(self.download_dir, f"{call_id}.mp3")] = (call_id, url)
+                for path, (call_id, url) in latest.items():
+                    if path in queued:
+                        self._retarget(queued[path], url)
+                        continue
+                    job = PipelineJob(call_id, url, path)
+                    if self.ledger is not None:
+                        job.resumed = self.ledger.completed_stages(call_id)
+                        if LEDGER_STAGES["compare"] in job.resumed:
+                            if not has_recording_since_compare(record, self.ledger):
+                                if path not in skipped:
+                                    skipped.add(path)
+                                    self.skipped += 1
+                                continue
+                            # Compared before this recording was made: redo the call with it
+                            print(f"🔁 {call_id} has a recording newer than its last comparison; processing again")
+                            job.resumed = set()
+                            if path in skipped:
+                                skipped.discard(path)
+                                self.skipped -= 1
+                    queued[path] = job
+                    job.stage_seconds["fetch"] = time.perf_counter() - started
+                    self._done(job, "fetch")
+                    self.jobs.append(job)
+                    await outbound.put(job)
+                    if self.limit is not None and len(self.jobs) >= self.limit:
+                        break
+        except Exception as e:
+            print(f"⚠️ Fetch stopped early: {e}")
+        finally:
+            close = getattr(records, "close", None)
+            if close is not None:
+                await self._call(close)
+            await outbound.put(_DONE)
+
+    def _retarget(self, job, url):
+        """
+        Point a queued job at a later recording of the same call. Jobs that have not
+        started transcribing pick it up; later ones keep the audio they already sent.
+        """
+        if url == job.url:
+            return
+        if job.transcribed_url is not None:
+            print(f"⚠️ {job.s_id} has another recording ({url}) but was already transcribed from {job.url}; "
+                  f"keeping that one")
+            inc("pipeline_recordings_total", outcome="late")
+            return
+        job.url = url
+
+    async def _fetch_audio(self, job) -> bool:
+        """
+        Download or stream the job's current recording. If the fetcher moved the job
+        to a later recording meanwhile, fetch that one instead. False if it failed.
+        """
+        started = time.perf_counter()
+        while job.audio_url != job.url:
+            url = job.url
+            if job.buffer is not None:
+                job.buffer.close()
+                job.buffer = None
+            try:
+                if self.stream:
+                    keep_path = job.path if self.keep_local else None
+                    job.buffer, _ = await self._call(stream_recording, self._session, url, keep_path=keep_path)
+                else:
+                    await self._call(download_file_resumable, self._session, url, job.path)
+            except Exception as e:
+                self._fail(job, "download", e)
+                return False
+            job.audio_url = url
+        job.stage_seconds["download"] = time.perf_counter() - started
+        if not self.stream or self.keep_local:
+            self._done(job, "download")
+        print(f"✅ {'Streamed' if self.stream else 'Downloaded'}: {job.url if self.stream else job.path}")
+        return True
+
+    async def _download(self, job, outbound):
+        already_downloaded = LEDGER_STAGES["download"] in job.resumed and os.path.exists(job.path)
+        if already_downloaded or LEDGER_STAGES["process"] in job.resumed:
+            if os.path.exists(job.path):
+                job.audio_url = job.url
+            await outbound.put(job)
+            return
+        if await self._fetch_audio(job):
+            await outbound.put(job)
+
+    async def _process(self, job, outbound):
+        if LEDGER_STAGES["process"] in job.resumed:
+            # Transcribed by an earlier run. The ledger is marked once the document is
+            # queued, so make sure that run lived to flush it before skipping the work.
+            try:
+                stored = await self._call(_has_audio_result, job.s_id)
+            except Exception as e:
+                self._fail(job, "process", e)
+                return
+            if stored:
+                await outbound.put(job)
+                return
+            print(f"⚠️ {job.s_id} was marked transcribed but has no audio_results document; processing again")
+        if job.buffer is None and not os.path.exists(job.path):
+            # Skipped by the download stage as transcribed, but the document is missing
+            # and so is the earlier run's file (fresh CI runner, or streamed)
+            job.audio_url = None
+        if job.audio_url != job.url:
+            # Not fetched yet, or a later recording of this call arrived after the download
+            if not await self._fetch_audio(job):
+                return
+        job.transcribed_url = job.url
+        source = job.path if job.buffer is None else job.buffer
+        upload_path = source
+        kwargs = {}
+        if job.buffer is not None:
+            kwargs["mime_type"] = guess_audio_mime_type(job.url)
+        # Cache hits skip preprocessing and take no rate-limit tokens
+        cached = None
+        try:
+            kwargs["cache_key"], cached = await self._call(
+                gemini_processing.find_cached_result, source, self.single_call, self.preprocess)
+        except Exception as e:
+            print(f"⚠️ Transcription cache lookup failed for {job.s_id}: {e}")
+        if not cached:
+            if job.buffer is None and self._preprocess_pool is not None:
+                started = time.perf_counter()
+                upload_path = await asyncio.get_running_loop().run_in_executor(
+                    self._preprocess_pool, preprocess_audio, job.path)
+                job.stage_seconds["preprocess"] = time.perf_counter() - started
+            await self._call(self.limiter.acquire, self._tokens_per_file)
+        started = time.perf_counter()
+        try:
+            result = await self._call(self.process_fn, upload_path, s_id=job.s_id, single_call=self.single_call,
+                                      preprocess=False, limiter=self.limiter, **kwargs)
+            if isinstance(result, dict):
+                job.transfer = result.get("transfer")
+        except Exception as e:
+            self._fail(job, "process", e)
+            return
+        finally:
+            if job.buffer is not None:
+                job.buffer.close()
+                job.buffer = None
+            elif upload_path != job.path:
+                discard_preprocessed(upload_path)
+        job.stage_seconds["process"] = time.perf_counter() - started
+        self._done(job, "process")
+        print(f"✅ Processed {job.s_id} in {job.stage_seconds['process']:.1f}s")
+        await outbound.put(job)
+
+    async def _reconcile(self, inbound, outbound):
+        call_index = await self._call_index
+        while True:
+            first = await inbound.get()
+            if first is _DONE:
+                break
+            batch, done = await self._drain(inbound, first, self.reconcile_batch)
+            started = time.perf_counter()
+            index = dict(call_index or {})
+            for call_id, entity in index_by_call_id(self._seen_records).items():
+                index.setdefault(call_id, entity)
+            try:
+                matched = await self._call(reconcile_s_ids, [job.s_id for job in batch], call_index=index)
+            except Exception as e:
+                for job in batch:
+                    self._fail(job, "reconcile", e)
+                matched = {}
+            seconds = time.perf_counter() - started
+            for job in batch:
+                if job.failed_stage:
+                    continue
+                job.stage_seconds["reconcile"] = seconds
+                job.match = matched.get(job.s_id)
+                if job.match is None:
+                    self._fail(job, "reconcile", "no GraphQL entity or MongoDB document")
+                    continue
+                self._done(job, "reconcile")
+                if self.export_excel:
+                    await self._call(write_combined_excel, job.s_id, job.match["entity_row"],
+                                     job.match["mongo_doc"], output_path=f"combined_{job.s_id}.xlsx")
+                await outbound.put(job)
+            if done:
+                break
+        await outbound.put(_DONE)
+
+    async def _compare(self, inbound):
+        async def _loop():
+            while True:
+                first = await inbound.get()
+                if first is _DONE:
+                    await inbound.put(_DONE)
+                    return
+                # Linger so calls finishing close together share a request
+                batch, done = await self._drain(inbound, first, self.compare_batch, self.compare_linger)
+                started = time.perf_counter()
+                pairs = [(job.match["dataset_a"], job.match["dataset_b"]) for job in batch]
+                try:
+                    stored = await self._call(self.compare_fn, pairs)
+                except Exception as e:
+                    for job in batch:
+                        self._fail(job, "compare", e)
+                else:
+                    finished = time.perf_counter()
+                    for job, document in zip(batch, stored or [None] * len(batch)):
+                        job.stage_seconds["compare"] = finished - started
+                        if document is None:
+                            self._fail(job, "compare", "comparison response was not valid JSON")
+                            continue
+                        job.finished = finished
+                        self._done(job, "compare")
+                if done:
+                    await inbound.put(_DONE)
+                    return
+
+        await asyncio.gather(*(_loop() for _ in range(self.workers["compare"])))
+
+    # --- entry point ---
+    async def run(self) -> dict:
+        """
+        Run every stage concurrently until the fetched calls have drained through.
+
+        Returns:
+            dict: summarize_jobs output plus "jobs", one to_dict() per call.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.workers.values()) + 2,
+                                            thread_name_prefix="pipeline")
+        self._session = create_download_session(self.workers["download"])
+        self._preprocess_pool = ProcessPoolExecutor(max_workers=max(1, PREPROCESS_WORKERS)) if self.preprocess else None
+        self._tokens_per_file = requests_per_file(self.single_call)
+        self._seen_records = []
+        self.jobs = []
+        self.skipped = 0
+        if self.ledger is None and not (self.stream and not self.keep_local):
+            clear_directory(self.download_dir, keep_partial=True)
+        if not self.stream or self.keep_local:
+            os.makedirs(self.download_dir, exist_ok=True)
+
+        download_q = asyncio.Queue(self.queue_size)
+        process_q = asyncio.Queue(self.queue_size)
+        reconcile_q = asyncio.Queue(self.queue_size)
+        compare_q = asyncio.Queue(self.queue_size)
+
+        # The reference call index loads while the first recordings download
+        if self.call_index is not None:
+            self._call_index = asyncio.get_running_loop().create_future()
+            self._call_index.set_result(self.call_index)
+        else:
+            self._call_index = asyncio.ensure_future(self._call(build_call_index))
+
+        started = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(self._fetch(download_q)),
+            asyncio.ensure_future(self._run_workers("download", download_q, process_q,
+                                                    lambda job: self._download(job, process_q))),
+            asyncio.ensure_future(self._run_workers("process", process_q, reconcile_q,
+                                                    lambda job: self._process(job, reconcile_q))),
+            asyncio.ensure_future(self._reconcile(reconcile_q, compare_q)),
+            asyncio.ensure_future(self._compare(compare_q)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+            await self._call(flush_all_writers)
+        except BaseException:
+            # One stage broke: stop the others before the thread pool goes away
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._session.close()
+            self._executor.shutdown(wait=False)
+            if self._preprocess_pool is not None:
+                self._preprocess_pool.shutdown(wait=False)
+        elapsed = time.perf_counter() - started
+
+        summary = summarize_jobs(self.jobs, elapsed, skipped=self.skipped)
+        record_job_metrics(self.jobs)
+        if self.skipped:
+            inc("pipeline_calls_total", self.skipped, outcome="skipped")
+        _print_summary(summary)
+        summary["jobs"] = [job.to_dict() for job in self.jobs]
+        return summary
+
+
+def run_pipeline(url: str, **kwargs) -> dict:
+    """
+    Synchronous wrapper: build a Pipeline with `kwargs` and run it to completion.
+    """
+    return asyncio.run(Pipeline(url, **kwargs).run())
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    run_pipeline("https://42fd29e5b225.ngrok-free.app/graphql", limit=10)
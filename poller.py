@@ -0,0 +1,169 @@
+import os
+import time
+from contextlib import closing
+
+from graphql_cache import format_iso_utc, merge_records, parse_range_bound, recording_timestamp
+from graphql_fetch import iter_call_data_transcribe
+from job_ledger import JobLedger
+from mongo_pool import flush_all_writers
+from pipeline import has_recording_since_compare, run_pipeline
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+GRAPHQL_URL = "https://42fd29e5b225.ngrok-free.app/graphql"
+POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", "300"))
+# First poll with an empty ledger looks this far back
+POLL_INITIAL_LOOKBACK_HOURS = float(os.getenv("POLL_INITIAL_LOOKBACK_HOURS", "24"))
+# Re-read this much before the watermark, for late-arriving recordings and retries
+# of recent failures; the ledger keeps already-compared calls from being redone.
+POLL_OVERLAP_SECONDS = int(os.getenv("POLL_OVERLAP_SECONDS", "600"))
+# An unfinished call holds the watermark back for this many polls, then is given up on
+POLL_MAX_ATTEMPTS = int(os.getenv("POLL_MAX_ATTEMPTS", "3"))
+
+WATERMARK_NAME = "dateCreatedInUpdates"
+
+
+# ---------------------------------------------
+# Incremental Fetch
+# ---------------------------------------------
+def fetch_new_recordings(url: str, watermark: str = None, now: float = None,
+                         overlap_seconds: int = POLL_OVERLAP_SECONDS,
+                         initial_lookback_hours: float = POLL_INITIAL_LOOKBACK_HOURS):
+    """
+    Fetch call records whose recordings are newer than the watermark.
+
+    Only the range from (watermark - overlap) to now is queried, bypassing the
+    GraphQL cache so fresh calls are seen. Each record keeps just its new recordings,
+    and a call returned on several pages comes back once with its recordings merged.
+
+    This assumes the server's fromDate/toDate select calls by
+    Recordings.dateCreatedInUpdates. Recordings are filtered again here, so a server
+    that filters on another date only costs extra records; a recording attached to
+    a call the server places outside the range would not be seen.
+
+    Args:
+        url (str): GraphQL endpoint URL.
+        watermark (str, optional): Highest dateCreatedInUpdates already pushed.
+            None starts `initial_lookback_hours` back.
+        now (float, optional): Epoch timestamp for the end of the range (default: now).
+        overlap_seconds (int): How far before the watermark to re-read.
+        initial_lookback_hours (float): Lookback when there is no watermark yet.
+
+    Returns:
+        tuple: (records, newest) where newest is the highest dateCreatedInUpdates
+        seen (ISO 8601), or the old watermark if nothing new arrived.
+    """
+    now = time.time() if now is None else now
+    if watermark:
+        since = parse_range_bound(watermark) - overlap_seconds
+    else:
+        since = now - initial_lookback_hours * 3600
+
+    records, newest_ts, newest = [], None, watermark
+    with closing(iter_call_data_transcribe(url, format_iso_utc(since), format_iso_utc(now),
+                                           use_cache=False)) as stream:
+        for record in stream:
+            fresh = []
+            for recording in record.get("Recordings") or []:
+                ts = recording_timestamp(recording)
+                if ts is None or ts < since:
+                    continue
+                fresh.append(recording)
+                if newest_ts is None or ts > newest_ts:
+                    newest_ts, newest = ts, recording["dateCreatedInUpdates"]
+            if fresh:
+                new_record = dict(record)
+                new_record["Recordings"] = fresh
+                records.append(new_record)
+    return merge_records([records]), newest
+
+
+def _resume_point(records, newest, ledger: JobLedger, max_attempts: int = POLL_MAX_ATTEMPTS):
+    """
+    Where the watermark may move after a pipeline run: `newest`, or the oldest
+    recording of a call that has not been compared yet (or was compared before that
+    recording was made), so the next poll fetches it again. A call stops holding the
+    watermark back after `max_attempts` polls.
+    """
+    resume_ts, resume = None, newest
+    for record in records:
+        call_id = record.get("callId")
+        if not call_id:
+            continue
+        if ledger.is_done(call_id, "compared") and not has_recording_since_compare(record, ledger):
+            continue
+        if ledger.attempts(call_id, "fetched") >= max_attempts:
+            print(f"⚠️ Giving up on {call_id} after {max_attempts} polls; the watermark moves past it")
+            continue
+        for recording in record.get("Recordings") or []:
+            ts = recording_timestamp(recording)
+            if ts is not None and (resume_ts is None or ts < resume_ts):
+                resume_ts, resume = ts, recording["dateCreatedInUpdates"]
+    return resume
+
+
+# ---------------------------------------------
+# Polling Loop
+# ---------------------------------------------
+def poll_once(url: str = GRAPHQL_URL, ledger: JobLedger = None, **pipeline_kwargs) -> dict:
+    """
+    One micro-batch: fetch recordings newer than the ledger's watermark, push only
+    those through the pipeline and advance the watermark, but never past a call that
+    failed or did not finish (up to POLL_MAX_ATTEMPTS polls), so it is fetched again.
+
+    Returns:
+        dict: {"records", "watermark", "report"} where report is the pipeline summary
+        (None when nothing new arrived).
+    """
+    ledger = ledger or JobLedger()
+    watermark = ledger.get_watermark(WATERMARK_NAME)
+    records, newest = fetch_new_recordings(url, watermark)
+
+    report = None
+    if records:
+        print(f"📥 {len(records)} call(s) with new recordings since {watermark or 'start'}")
+        # The fetched records already carry the GraphQL entity, so no reference index is needed
+        pipeline_kwargs.setdefault("call_index", {})
+        report = run_pipeline(url, records=records, ledger=ledger, limit=None, **pipeline_kwargs)
+        flush_all_writers()
+        newest = _resume_point(records, newest, ledger)
+    watermark = ledger.advance_watermark(newest, WATERMARK_NAME, key=parse_range_bound)
+    return {"records": len(records), "watermark": watermark, "report": report}
+
+
+def run_polling(url: str = GRAPHQL_URL, interval_seconds: int = POLL_INTERVAL_SECONDS,
+                ledger: JobLedger = None, max_cycles: int = None, **pipeline_kwargs):
+    """
+    Poll every `interval_seconds` until interrupted (or `max_cycles` polls).
+
+    A failed cycle is logged and retried on the next tick without moving the
+    watermark. Calls that failed a stage hold the watermark back, so they are
+    fetched and retried on the following polls (up to POLL_MAX_ATTEMPTS).
+    """
+    ledger = ledger or JobLedger()
+    cycle = 0
+    while max_cycles is None or cycle < max_cycles:
+        cycle += 1
+        started = time.time()
+        try:
+            result = poll_once(url, ledger, **pipeline_kwargs)
+            if not result["records"]:
+                print(f"💤 No new recordings (watermark {result['watermark']})")
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            print(f"❌ Poll failed: {e}")
+        if max_cycles is not None and cycle >= max_cycles:
+            break
+        time.sleep(max(0.0, interval_seconds - (time.time() - started)))
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    try:
+        run_polling()
+    except KeyboardInterrupt:
+        print("\n👋 Polling stopped")
@@ -1,14 +1,12 @@
 import os
 
-from gemini_processing import process_audio_file  # import your existing function
+from audio_pool import process_audio_folder
 
 
 
 # --------------------------------------------
 
-import os
-
 folder = "downloads"
 
-for filename in os.listdir(folder):
-    process_audio_file(os.path.join(folder, filename),s_id=filename.split(".")[0])
\ No newline at end of file
+# Runs process_audio_file concurrently, limited to GEMINI_RPM model requests per minute
+process_audio_folder(folder)
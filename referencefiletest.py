@@ -2,7 +2,9 @@ import requests
 import json
 import pandas as pd
 import os
-from pymongo import MongoClient
+from mongo_pool import ensure_indexes, find_by_s_ids, get_collection
+from graphql_cache import fetch_call_data
+from creating_reference_excel import flatten_entity, index_by_call_id
 
 # =====================================================
 # CONFIGURATION
@@ -31,13 +33,12 @@ def match_sids_to_graphql(s_ids=None, from_date="2025-10-01T18:30:00.000Z", to_d
     # -------------------------------------
     # Connect MongoDB
     # -------------------------------------
-    client = MongoClient(MONGO_URI)
-    db = client["audio_processing"]
-    collection = db["audio_results"]
+    ensure_indexes(MONGO_URI)
+    collection = get_collection("audio_processing", "audio_results", MONGO_URI)
 
     # Auto-fetch latest if not given
     if s_ids in [None, "latest"]:
-        latest_doc = collection.find_one(sort=[("_id", -1)])
+        latest_doc = collection.find_one(projection={"s_id": 1}, sort=[("_id", -1)])
         if not latest_doc:
             raise Exception("❌ No document found in MongoDB.")
         s_ids = [latest_doc.get("s_id")]
@@ -48,50 +49,14 @@ def match_sids_to_graphql(s_ids=None, from_date="2025-10-01T18:30:00.000Z", to_d
     # -------------------------------------
     # GraphQL Query
     # -------------------------------------
-    query = f"""
-    query GetEntityByHid {{
-        getCallDataTranscribe(
-            fromDate: "{from_date}"
-            toDate: "{to_date}"
-        ) {{
-            s3Uploaded
-            entityId
-            callId
-            entityName
-            state
-            phone
-            city
-            country
-            status
-            description
-            securityDeposit
-            minRent
-            maxRent
-            ownerName
-            email
-            startedYear
-            fullTimeWarden
-            visitorsAllowed
-            website
-            entityType
-            totalBeds
-            Recordings {{
-                s3Url
-                dateCreatedInUpdates
-            }}
-        }}
-    }}
-    """
-
-    response = requests.post(GRAPHQL_URL, json={"query": query})
-    if response.status_code != 200:
-        raise Exception(f"❌ GraphQL query failed! ({response.status_code}) → {response.text}")
-
-    data = response.json()
-    entities = data.get("data", {}).get("getCallDataTranscribe", [])
+    try:
+        entities = fetch_call_data(GRAPHQL_URL, from_date, to_date)
+    except requests.HTTPError as e:
+        raise Exception(f"❌ GraphQL query failed! ({e.response.status_code}) → {e.response.text}")
     if not entities:
         raise Exception("❌ No results found from GraphQL query.")
-    graphql_df = pd.DataFrame(entities)
+    call_index = index_by_call_id(entities)
+    mongo_by_sid = find_by_s_ids(collection, [sid for sid in s_ids if sid in call_index])
 
     # -------------------------------------
     # Match Each s_id
@@ -100,23 +65,17 @@ def match_sids_to_graphql(s_ids=None, from_date="2025-10-01T18:30:00.000Z", to_d
     mongo_docs = []
 
     for sid in s_ids:
-        match_row = graphql_df[graphql_df["callId"] == sid]
+        entity = call_index.get(sid)
 
-        if match_row.empty:
+        if entity is None:
             print(f"❌ No matching callId found for s_id: {sid}")
             continue
 
         print(f"✅ Matching callId found for s_id: {sid}")
 
-        entity_row = match_row.iloc[0].to_dict()
-        recordings = entity_row.get("Recordings", [])
-        if isinstance(recordings, list) and recordings:
-            entity_row["recordings_count"] = len(recordings)
-            entity_row["first_recording_url"] = recordings[0].get("s3Url")
-            entity_row["first_recording_date"] = recordings[0].get("dateCreatedInUpdates")
-        entity_row.pop("Recordings", None)
+        entity_row = flatten_entity(entity)
 
-        mongo_doc = collection.find_one({"s_id": sid})
+        mongo_doc = mongo_by_sid.get(sid)
         mongo_docs.append(mongo_doc)
 
         mongo_summary = {
@@ -0,0 +1,78 @@
+import itertools
+
+import pytest
+
+from benchmark import FakeCollection
+from mongo_pool import BufferedUpsertWriter
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def collection():
+    # A fresh name per test, since ensure_unique_index remembers collections by name
+    return FakeCollection(f"tests.writer_{next(_names)}")
+
+
+def test_readding_a_key_replaces_the_document(collection):
+    writer = BufferedUpsertWriter(collection, max_batch=100, max_delay=0)
+
+    writer.add({"s_id": "a", "text": "first"})
+    writer.flush()
+    writer.add({"s_id": "a", "text": "second", "_id": 99})
+    writer.add({"s_id": "a", "text": "third"})
+    assert writer.flush() == 1
+
+    docs = list(collection.find({"s_id": "a"}))
+    assert len(docs) == 1
+    assert docs[0]["text"] == "third"
+
+
+def test_unkeyed_documents_are_inserted_without_a_null_key(collection):
+    writer = BufferedUpsertWriter(collection, max_batch=100, max_delay=0)
+
+    writer.add({"s_id": None, "text": "one"})
+    writer.add({"text": "two"})
+    assert writer.flush() == 2
+
+    docs = list(collection.find())
+    assert [doc["text"] for doc in docs] == ["one", "two"]
+    assert all("s_id" not in doc for doc in docs)
+
+
+def test_rejected_operation_is_recorded_and_the_rest_are_written(collection):
+    collection.reject[("s_id", "bad")] = "Document failed validation"
+    writer = BufferedUpsertWriter(collection, max_batch=100, max_delay=0)
+
+    for s_id in ("good", "bad", "also-good"):
+        writer.add({"s_id": s_id})
+    assert writer.flush() == 2
+
+    assert writer.failed == {"bad": "Document failed validation"}
+    assert sorted(doc["s_id"] for doc in collection.find()) == ["also-good", "good"]
+    assert writer.find_pending("s_id", "bad") is None
+    assert writer.flush() == 0
+
+
+def test_readding_a_failed_key_clears_the_failure(collection):
+    collection.reject[("s_id", "bad")] = "Document failed validation"
+    writer = BufferedUpsertWriter(collection, max_batch=100, max_delay=0)
+    writer.add({"s_id": "bad"})
+    writer.flush()
+
+    collection.reject.clear()
+    writer.add({"s_id": "bad"})
+
+    assert writer.failed == {}
+    assert writer.flush() == 1
+    assert collection.count_documents({"s_id": "bad"}) == 1
+
+
+def test_batch_fills_trigger_a_flush(collection):
+    writer = BufferedUpsertWriter(collection, max_batch=2, max_delay=0)
+
+    writer.add({"s_id": "a"})
+    assert collection.count_documents() == 0
+    writer.add({"s_id": "b"})
+
+    assert collection.count_documents() == 2
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from benchmark import FakeAudioServer
+from download_recordings import (
+    PARTIAL_META_SUFFIX,
+    PARTIAL_SUFFIX,
+    create_download_session,
+    download_file_resumable,
+    stream_recording,
+)
+
+
+@pytest.fixture
+def server():
+    server = FakeAudioServer(size=256 * 1024)
+    yield server
+    server.close()
+
+
+def test_dropped_download_resumes_with_range(server, tmp_path):
+    url = f"{server.base_url}/call1.mp3"
+    target = tmp_path / "call1.mp3"
+    server.drop_after = 100 * 1024
+
+    result = download_file_resumable(create_download_session(), url, str(target), chunk_size=16 * 1024)
+
+    expected = server.recording("/call1.mp3")
+    assert target.read_bytes() == expected
+    assert result == {"bytes": len(expected), "resumed_from": 0}
+    assert server.range_requests == 1
+    assert not os.path.exists(str(target) + PARTIAL_SUFFIX)
+    assert not os.path.exists(str(target) + PARTIAL_META_SUFFIX)
+
+
+def test_leftover_partial_is_resumed(server, tmp_path):
+    url = f"{server.base_url}/call2.mp3"
+    target = tmp_path / "call2.mp3"
+    expected = server.recording("/call2.mp3")
+    etag = '"%s"' % hashlib.md5(expected).hexdigest()
+    (tmp_path / ("call2.mp3" + PARTIAL_SUFFIX)).write_bytes(expected[:5000])
+    (tmp_path / ("call2.mp3" + PARTIAL_META_SUFFIX)).write_text(json.dumps({"etag": etag}))
+
+    result = download_file_resumable(create_download_session(), url, str(target))
+
+    assert target.read_bytes() == expected
+    assert result["resumed_from"] == 5000
+    assert server.range_requests == 1
+
+
+def test_stale_partial_falls_back_to_full_download(server, tmp_path):
+    # If-Range no longer matches, so the server sends the whole (changed) object
+    url = f"{server.base_url}/call3.mp3"
+    target = tmp_path / "call3.mp3"
+    (tmp_path / ("call3.mp3" + PARTIAL_SUFFIX)).write_bytes(b"x" * 5000)
+    (tmp_path / ("call3.mp3" + PARTIAL_META_SUFFIX)).write_text(json.dumps({"etag": '"stale"'}))
+
+    result = download_file_resumable(create_download_session(), url, str(target))
+
+    assert target.read_bytes() == server.recording("/call3.mp3")
+    assert result["resumed_from"] == 0
+    assert server.range_requests == 0
+
+
+def test_dropped_stream_resumes_with_range(server):
+    url = f"{server.base_url}/call4.mp3"
+    server.drop_after = 70 * 1024
+
+    buffer, info = stream_recording(create_download_session(), url, max_memory=64 * 1024, chunk_size=8 * 1024)
+    try:
+        expected = server.recording("/call4.mp3")
+        assert buffer.read() == expected
+        assert info["bytes"] == len(expected)
+        assert server.range_requests == 1
+    finally:
+        buffer.close()
@@ -0,0 +1,103 @@
+import time
+import asyncio
+
+import pytest
+
+from benchmark import FakeAudioServer, FakeMongoClient
+from graphql_cache import format_iso_utc
+from job_ledger import JobLedger
+from mongo_pool import set_mongo_client
+from pipeline import Pipeline
+
+
+@pytest.fixture
+def server():
+    server = FakeAudioServer(size=4096)
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def mongo():
+    client = FakeMongoClient()
+    set_mongo_client(client)
+    return client
+
+
+def _record(call_id, *urls, created=None):
+    recordings = [{"s3Url": url} for url in urls]
+    if created is not None:
+        for recording in recordings:
+            recording["dateCreatedInUpdates"] = format_iso_utc(created)
+    return {"callId": call_id, "Recordings": recordings}
+
+
+def _compared_ledger(tmp_path, *call_ids):
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    for call_id in call_ids:
+        for stage in ("fetched", "downloaded", "transcribed", "reconciled", "compared"):
+            ledger.mark(call_id, stage)
+    return ledger
+
+
+def _run(server, records, tmp_path, **kwargs):
+    """Run the pipeline over `records`; returns (summary, {s_id: audio bytes transcribed})."""
+    transcribed = {}
+
+    def process_fn(source, s_id=None, **_):
+        with open(source, "rb") as f:
+            transcribed[s_id] = f.read()
+        return {"transfer": "inline"}
+
+    pipeline = Pipeline(server.base_url, records=records, download_dir=str(tmp_path / "downloads"), call_index={},
+                        process_fn=process_fn, compare_fn=lambda pairs: [], requests_per_minute=100000,
+                        preprocess=False, stream=False, **kwargs)
+    return asyncio.run(pipeline.run()), transcribed
+
+
+def test_call_with_several_recordings_keeps_the_last(server, tmp_path):
+    first, last = f"{server.base_url}/a-1.mp3", f"{server.base_url}/a-2.mp3"
+
+    summary, transcribed = _run(server, [_record("a", first, last)], tmp_path)
+
+    assert [job["url"] for job in summary["jobs"]] == [last]
+    assert transcribed == {"a": server.recording("/a-2.mp3")}
+
+
+def test_repeated_call_id_moves_the_job_to_the_later_recording(server, tmp_path):
+    # iter_call_data_transcribe yields a repeat carrying only the new Recordings
+    records = [_record("a", f"{server.base_url}/a-1.mp3"), _record("b", f"{server.base_url}/b.mp3"),
+               _record("a", f"{server.base_url}/a-2.mp3")]
+
+    summary, transcribed = _run(server, records, tmp_path)
+
+    assert sorted(job["s_id"] for job in summary["jobs"]) == ["a", "b"]
+    assert transcribed["a"] == server.recording("/a-2.mp3")
+    assert transcribed["b"] == server.recording("/b.mp3")
+
+
+def test_transcribed_call_without_result_or_file_is_downloaded_again(server, tmp_path):
+    # An earlier run marked the call transcribed, but its audio_results document
+    # never landed and this runner has no downloads/ from that run
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    for stage in ("fetched", "downloaded", "transcribed"):
+        ledger.mark("a", stage)
+
+    summary, transcribed = _run(server, [_record("a", f"{server.base_url}/a.mp3")], tmp_path, ledger=ledger)
+
+    assert summary["jobs"][0]["failed_stage"] != "process"
+    assert transcribed == {"a": server.recording("/a.mp3")}
+    ledger.close()
+
+
+def test_compared_call_is_redone_for_a_newer_recording(server, tmp_path):
+    ledger = _compared_ledger(tmp_path, "old", "new")
+    records = [_record("old", f"{server.base_url}/old.mp3", created=time.time() - 3600),
+               _record("new", f"{server.base_url}/new.mp3", created=time.time() + 60)]
+
+    summary, transcribed = _run(server, records, tmp_path, ledger=ledger)
+
+    assert summary["skipped"] == 1
+    assert [job["s_id"] for job in summary["jobs"]] == ["new"]
+    assert transcribed == {"new": server.recording("/new.mp3")}
+    ledger.close()
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+import audio_pool
+from audio_pool import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; sleep() advances it and records how long it waited."""
+    state = SimpleNamespace(now=1000.0, slept=[])
+
+    def sleep(seconds):
+        state.slept.append(seconds)
+        state.now += seconds
+
+    monkeypatch.setattr(audio_pool, "time", SimpleNamespace(monotonic=lambda: state.now, sleep=sleep))
+    return state
+
+
+def test_oversized_request_goes_through_and_leaves_debt(clock):
+    bucket = TokenBucket(6, capacity=1)
+
+    bucket.acquire(3)
+
+    assert clock.slept == []
+    assert bucket._tokens == pytest.approx(-2)
+
+
+def test_debt_is_repaid_before_the_next_request(clock):
+    bucket = TokenBucket(6, capacity=1)  # one token every 10 seconds
+    bucket.acquire(3)
+
+    bucket.acquire()
+
+    # Two tokens of debt plus the one requested: 30 seconds at 6/minute
+    assert sum(clock.slept) == pytest.approx(30)
+    assert bucket._tokens == pytest.approx(0)
+
+
+def test_long_run_rate_holds_with_oversized_requests(clock):
+    bucket = TokenBucket(60, capacity=2)
+    start = clock.now
+
+    for _ in range(5):
+        bucket.acquire(4)
+
+    # 20 tokens at one per second, less the two the bucket started with and
+    # the two the last request still owes
+    assert clock.now - start == pytest.approx(16)
+    assert bucket._tokens == pytest.approx(-2)
@@ -0,0 +1,330 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+TRANSCRIPT_INDEX_PATH = os.getenv("TRANSCRIPT_INDEX_PATH", "transcript_index.sqlite3")
+# save_to_mongo keeps the index up to date unless TRANSCRIPT_INDEX=0
+TRANSCRIPT_INDEX_ENABLED = os.getenv("TRANSCRIPT_INDEX", "1") == "1"
+MONGO_DB = "audio_processing"
+MONGO_COLLECTION = "audio_results"
+
+# "[MM:SS] Speaker: text" (or [HH:MM:SS]); the speaker label is optional
+_SEGMENT = re.compile(
+    r"^\s*\[(\d{1,3}):(\d{2})(?::(\d{2}))?\]\s*(?:([^:\[\]\d][^:\[\]]{0,39}?):\s+)?(.*)$"
+)
+# Amounts as spoken in enquiry calls: 8500, 10,000, Rs.12k, ₹.5000, 1.5 lakh. A number
+# right after "<digit>." is the tail of a decimal or dotted date, not an amount of its own.
+_AMOUNT = re.compile(r"(?<!\w)(?<!\d\.)(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakhs?|lacs?)?\b", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1000, "thousand": 1000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000}
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+# ---------------------------------------------
+# Parsing
+# ---------------------------------------------
+def parse_segments(transcription: str) -> list:
+    """
+    Split a `[MM:SS] Speaker: ...` transcription into timed segments.
+
+    Lines without a timestamp continue the previous segment (text before the first
+    timestamp starts at 0).
+
+    Returns:
+        list: {"start_ms", "speaker", "text"} dicts in transcript order.
+    """
+    segments = []
+    for line in (transcription or "").splitlines():
+        match = _SEGMENT.match(line)
+        if match:
+            first, second, third, speaker, text = match.groups()
+            if third is None:
+                seconds = int(first) * 60 + int(second)
+            else:
+                seconds = int(first) * 3600 + int(second) * 60 + int(third)
+            segments.append({"start_ms": seconds * 1000, "speaker": (speaker or "").strip(), "text": text.strip()})
+        elif line.strip():
+            if segments:
+                segments[-1]["text"] = f"{segments[-1]['text']} {line.strip()}".strip()
+            else:
+                segments.append({"start_ms": 0, "speaker": "", "text": line.strip()})
+    return [segment for segment in segments if segment["text"]]
+
+
+def extract_amounts(text: str) -> list:
+    """
+    Numbers mentioned in `text` as plain values, e.g. "Rs.10,000" → 10000, "1.5 lakh" → 150000.
+    """
+    amounts = []
+    for digits, unit in _AMOUNT.findall(text or ""):
+        try:
+            value = float(digits.replace(",", ""))
+        except ValueError:
+            continue
+        amounts.append(value * _MULTIPLIERS.get((unit or "").lower(), 1))
+    return amounts
+
+
+def _match_expression(query: str) -> str:
+    # Plain words become quoted terms ANDed together, so user input is never FTS5 syntax
+    return " ".join(f'"{term}"' for term in _TERM.findall(query or ""))
+
+
+# ---------------------------------------------
+# Index
+# ---------------------------------------------
+class TranscriptIndex:
+    """
+    Local SQLite FTS5 index of transcription segments, keyed by s_id.
+
+    Each `[MM:SS]` line is one row with its start time in milliseconds, so a search
+    returns the calls *and* the moments that matched. Numbers said in each segment
+    go into a side table for range filters ("deposit above 10000"). Re-indexing an
+    s_id replaces its rows; an unchanged transcription is skipped by content hash.
+    """
+
+    def __init__(self, path: str = TRANSCRIPT_INDEX_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    s_id         TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    segments     INTEGER NOT NULL,
+                    indexed_at   REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+                    text, speaker, s_id UNINDEXED, start_ms UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(amounts)")}
+            if columns and "segment_id" not in columns:
+                # Older index keyed amounts by (s_id, start_ms); rebuilt from segments below
+                self._conn.execute("DROP TABLE amounts")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS amounts (
+                    segment_id INTEGER NOT NULL,
+                    s_id       TEXT NOT NULL,
+                    value      REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS amounts_value ON amounts (value)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS amounts_segment ON amounts (segment_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS amounts_s_id ON amounts (s_id)")
+            if columns and "segment_id" not in columns:
+                segments = self._conn.execute("SELECT rowid, s_id, text FROM segments").fetchall()
+                self._conn.executemany(
+                    "INSERT INTO amounts (segment_id, s_id, value) VALUES (?, ?, ?)",
+                    [(rowid, s_id, value) for rowid, s_id, text in segments for value in extract_amounts(text)],
+                )
+
+    def add(self, s_id: str, transcription: str) -> bool:
+        """
+        Index (or re-index) the transcription of `s_id`.
+
+        Returns:
+            bool: False when the stored transcription is identical and nothing changed.
+        """
+        content_hash = hashlib.sha256((transcription or "").encode("utf-8")).hexdigest()
+        segments = parse_segments(transcription)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT content_hash FROM transcripts WHERE s_id = ?", (s_id,)
+            ).fetchone()
+            if row and row[0] == content_hash:
+                return False
+            self._delete(s_id)
+            amounts = []
+            for seg in segments:
+                cursor = self._conn.execute(
+                    "INSERT INTO segments (text, speaker, s_id, start_ms) VALUES (?, ?, ?, ?)",
+                    (seg["text"], seg["speaker"], s_id, seg["start_ms"]),
+                )
+                amounts.extend((cursor.lastrowid, s_id, value) for value in extract_amounts(seg["text"]))
+            self._conn.executemany("INSERT INTO amounts (segment_id, s_id, value) VALUES (?, ?, ?)", amounts)
+            self._conn.execute(
+                "INSERT INTO transcripts (s_id, content_hash, segments, indexed_at) VALUES (?, ?, ?, ?)",
+                (s_id, content_hash, len(segments), time.time()),
+            )
+        return True
+
+    def remove(self, s_id: str):
+        with self._lock, self._conn:
+            self._delete(s_id)
+
+    def _delete(self, s_id: str):
+        self._conn.execute("DELETE FROM segments WHERE s_id = ?", (s_id,))
+        self._conn.execute("DELETE FROM amounts WHERE s_id = ?", (s_id,))
+        self._conn.execute("DELETE FROM transcripts WHERE s_id = ?", (s_id,))
+
+    def search(self, query: str = None, min_amount: float = None, max_amount: float = None,
+               speaker: str = None, limit: int = 50) -> list:
+        """
+        Find calls by words said and/or amounts mentioned.
+
+        Args:
+            query (str, optional): Words that must all occur in one segment, e.g. "Palayam".
+            min_amount (float, optional): Only segments mentioning a number >= this.
+            max_amount (float, optional): Only segments mentioning a number <= this.
+            speaker (str, optional): Only segments whose speaker label contains this.
+            limit (int): Maximum number of calls returned.
+
+        Returns:
+            list: [{"s_id": str, "hits": [{"start_ms", "speaker", "text"}, ...]}], best
+            text matches first (most recently indexed first for amount-only searches).
+            Hits within a call are in time order.
+        """
+        expression = _match_expression(query)
+        if not expression and min_amount is None and max_amount is None:
+            return []
+
+        sql = ["SELECT s.s_id, s.start_ms, s.speaker, s.text"]
+        params = []
+        if expression:
+            sql.append(", bm25(segments) AS rank FROM segments AS s WHERE segments MATCH ?")
+            params.append(expression)
+        else:
+            sql.append(", 0 AS rank FROM segments AS s WHERE 1")
+        if min_amount is not None or max_amount is not None:
+            sql.append("AND EXISTS (SELECT 1 FROM amounts AS a WHERE a.segment_id = s.rowid")
+            if min_amount is not None:
+                sql.append("AND a.value >= ?")
+                params.append(min_amount)
+            if max_amount is not None:
+                sql.append("AND a.value <= ?")
+                params.append(max_amount)
+            sql.append(")")
+        if speaker:
+            sql.append("AND s.speaker LIKE ?")
+            params.append(f"%{speaker}%")
+
+        with self._lock:
+            rows = self._conn.execute(" ".join(sql), params).fetchall()
+            order = {}
+            if not expression and rows:
+                order = dict(self._conn.execute("SELECT s_id, -indexed_at FROM transcripts").fetchall())
+
+        calls = {}
+        for s_id, start_ms, seg_speaker, text, rank in rows:
+            entry = calls.setdefault(s_id, {"s_id": s_id, "hits": [], "rank": order.get(s_id, rank)})
+            entry["rank"] = min(entry["rank"], order.get(s_id, rank))
+            entry["hits"].append({"start_ms": int(start_ms), "speaker": seg_speaker, "text": text})
+
+        results = sorted(calls.values(), key=lambda entry: entry["rank"])[:max(0, limit)]
+        for entry in results:
+            entry.pop("rank")
+            entry["hits"].sort(key=lambda hit: hit["start_ms"])
+        return results
+
+    def indexed_s_ids(self) -> dict:
+        """
+        {s_id: content_hash} for every indexed call.
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT s_id, content_hash FROM transcripts").fetchall())
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls, segments = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(segments), 0) FROM transcripts"
+            ).fetchone()
+        return {"calls": calls, "segments": segments}
+
+    def backfill(self, collection=None, batch_size: int = 500) -> int:
+        """
+        Index every stored transcription once, e.g. to seed a new index from
+        audio_processing.audio_results. Unchanged documents are skipped.
+
+        Returns:
+            int: Number of calls (re-)indexed.
+        """
+        if collection is None:
+            from mongo_pool import get_collection
+            collection = get_collection(MONGO_DB, MONGO_COLLECTION)
+        indexed = 0
+        cursor = collection.find({}, {"_id": 0, "s_id": 1, "transcription": 1}).batch_size(batch_size)
+        for document in cursor:
+            if document.get("s_id") and document.get("transcription"):
+                indexed += self.add(document["s_id"], document["transcription"])
+        return indexed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------------------------------------
+# Shared Index
+# ---------------------------------------------
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(path: str = None) -> TranscriptIndex:
+    """
+    The process-wide index at TRANSCRIPT_INDEX_PATH, opened on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None or (path and os.path.abspath(path) != os.path.abspath(_index.path)):
+            _index = TranscriptIndex(path or TRANSCRIPT_INDEX_PATH)
+        return _index
+
+
+def index_transcription(s_id: str, transcription: str) -> bool:
+    """
+    Incremental update used by save_to_mongo. Never raises: a failed index write
+    only costs search coverage, not the stored result.
+    """
+    if not TRANSCRIPT_INDEX_ENABLED or not s_id:
+        return False
+    try:
+        return get_index().add(s_id, transcription)
+    except Exception as e:
+        print(f"⚠️ Could not index transcription for {s_id}: {e}")
+        return False
+
+
+def search_transcripts(query: str = None, **kwargs) -> list:
+    """
+    Shortcut for get_index().search(...).
+    """
+    return get_index().search(query, **kwargs)
+
+
+def format_ms(start_ms: int) -> str:
+    seconds = int(start_ms) // 1000
+    return f"[{seconds // 60:02d}:{seconds % 60:02d}]"
+
+
+# ---------------------------------------------
+# Example usage
+# ---------------------------------------------
+if __name__ == "__main__":
+    index = get_index()
+    print(f"♻️ Indexed {index.backfill()} new or changed transcriptions ({index.stats()})")
+    for description, kwargs in (("Palayam", {"query": "Palayam"}),
+                                ("deposit above 10000", {"query": "deposit", "min_amount": 10000})):
+        print(f"\n🔎 {description}")
+        for call in index.search(**kwargs):
+            for hit in call["hits"]:
+                print(f"  {call['s_id']} {format_ms(hit['start_ms'])} {hit['speaker']}: {hit['text']}")
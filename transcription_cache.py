@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from mongo_pool import get_collection, get_writer
+
+# ---------------------------------------------
+# Configuration
+# ---------------------------------------------
+CACHE_DIR = os.getenv("TRANSCRIPTION_CACHE_DIR", ".transcription_cache")
+# Also keep entries in MongoDB so every runner (not just this disk) can reuse them
+USE_MONGO = os.getenv("TRANSCRIPTION_CACHE_MONGO", "0") == "1"
+MONGO_DB = "audio_processing"
+MONGO_COLLECTION = "transcription_cache"
+
+
+# ---------------------------------------------
+# Keys
+# ---------------------------------------------
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    SHA-256 of a file's contents, read in chunks. `path` may also be a seekable
+    binary file object, which is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    if hasattr(path, "read"):
+        path.seek(0)
+        for block in iter(lambda: path.read(chunk_size), b""):
+            digest.update(block)
+        path.seek(0)
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prompt_version(*parts) -> str:
+    """
+    Short hash of the prompts/schema that shape a result. Editing any prompt
+    changes the version and therefore misses the cache.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def cache_key(audio_sha256: str, model: str, prompt_hash: str) -> str:
+    return f"{audio_sha256}:{model}:{prompt_hash}"
+
+
+def _local_path(key: str) -> str:
+    name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, name[:2], f"{name}.json")
+
+
+# ---------------------------------------------
+# Store
+# ---------------------------------------------
+def get_cached(key: str):
+    """
+    Return the cached {"transcription", "summary", "insights", ...} entry for `key`,
+    checking the local store first and MongoDB second (when enabled). None on a miss.
+    """
+    try:
+        with open(_local_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if USE_MONGO:
+        try:
+            entry = get_collection(MONGO_DB, MONGO_COLLECTION).find_one({"cache_key": key}, {"_id": 0})
+        except Exception as e:
+            print(f"⚠️ Transcription cache lookup in MongoDB failed: {e}")
+            entry = None
+        if entry:
+            _write_local(key, entry)
+            return entry
+    return None
+
+
+def put_cached(key: str, transcription: str, summary: str, insights, model: str, prompt_hash: str):
+    """
+    Store a processed result under `key` locally and, when enabled, in MongoDB.
+    """
+    entry = {
+        "cache_key": key,
+        "transcription": transcription,
+        "summary": summary,
+        "insights": insights,
+        "model": model,
+        "prompt_version": prompt_hash,
+        "created_at": time.time(),
+    }
+    try:
+        _write_local(key, entry)
+    except OSError as e:
+        print(f"⚠️ Could not write transcription cache entry: {e}")
+    if USE_MONGO:
+        try:
+            get_writer(MONGO_DB, MONGO_COLLECTION, key="cache_key").add(entry)
+        except Exception as e:
+            print(f"⚠️ Could not queue transcription cache entry for MongoDB: {e}")
+
+
+def _write_local(key: str, entry: dict):
+    path = _local_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A unique temp file per writer: threads of one process may store the same key at once
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise